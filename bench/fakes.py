@@ -0,0 +1,207 @@
+import asyncio
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import discord
+
+FRAME_SECONDS = 0.02
+OPUS_SILENCE = b'\xf8\xff\xfe'
+
+
+class SyntheticAudio(discord.AudioSource):
+    """Stand-in for FFmpeg when it isn't installed: Opus silence frames.
+
+    Takes the same arguments as discord.FFmpegOpusAudio so from_data runs
+    unchanged; the track length comes from the stub URL's d= parameter and
+    -ss in before_options is honoured.
+    """
+
+    def __init__(self, source, *, before_options=None, options=None, **kwargs):
+        duration = float(parse_qs(urlparse(source).query).get('d', ['10'])[0])
+        seek = re.search(r'-ss (\d+(?:\.\d+)?)', before_options or '')
+        start = float(seek.group(1)) if seek else 0.0
+        self.remaining = max(0, int((duration - start) / FRAME_SECONDS))
+
+    def read(self):
+        if self.remaining <= 0:
+            return b''
+        self.remaining -= 1
+        return OPUS_SILENCE
+
+    def is_opus(self):
+        return True
+
+
+class _Playback:
+    def __init__(self, source, after):
+        self.source = source
+        self.after = after
+        self.stopped = False
+        self.paused = False
+
+
+class FakeVoiceClient:
+    """Plays sources the way discord.py's AudioPlayer does: a thread per
+    connection reading one frame every 20 ms, then calling after()."""
+
+    def __init__(self, guild, channel, speed=1.0):
+        self.guild = guild
+        self.channel = channel
+        self.speed = speed
+        self._playback = None
+        self._connected = True
+        self.plays = 0
+        self.frames_sent = 0
+        self.late_frames = 0
+
+    # discord.VoiceClient surface used by the bot
+    def is_connected(self):
+        return self._connected
+
+    def is_playing(self):
+        return self._playback is not None and not self._playback.paused
+
+    def is_paused(self):
+        return self._playback is not None and self._playback.paused
+
+    @property
+    def source(self):
+        return self._playback.source if self._playback else None
+
+    @source.setter
+    def source(self, value):
+        if self._playback is None:
+            raise discord.ClientException("Not playing anything.")
+        self._playback.source = value
+
+    def play(self, source, *, after=None):
+        if self._playback is not None:
+            raise discord.ClientException("Already playing audio.")
+        playback = self._playback = _Playback(source, after)
+        self.plays += 1
+        threading.Thread(target=self._run, args=(playback,), daemon=True).start()
+
+    def pause(self):
+        if self._playback:
+            self._playback.paused = True
+
+    def resume(self):
+        if self._playback:
+            self._playback.paused = False
+
+    def stop(self):
+        if self._playback:
+            self._playback.stopped = True
+            self._playback = None
+
+    async def disconnect(self, *, force=False):
+        self.stop()
+        self._connected = False
+        self.guild.voice_client = None
+
+    def _run(self, playback):
+        interval = FRAME_SECONDS / self.speed
+        next_at = time.perf_counter()
+        error = None
+        try:
+            while not playback.stopped:
+                if playback.paused:
+                    time.sleep(interval)
+                    next_at = time.perf_counter()
+                    continue
+                if not playback.source.read():
+                    break
+                self.frames_sent += 1
+                next_at += interval
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                elif delay < -interval:
+                    self.late_frames += 1  # listeners would hear this
+        except Exception as e:
+            error = e
+        finally:
+            if self._playback is playback:
+                self._playback = None
+            if playback.after:
+                playback.after(error)
+            playback.source.cleanup()
+
+
+class FakeMessage:
+    def __init__(self, channel):
+        self.channel = channel
+
+    async def edit(self, **kwargs):
+        await asyncio.sleep(self.channel.latency)
+        self.channel.edits += 1
+        return self
+
+    async def delete(self):
+        await asyncio.sleep(self.channel.latency)
+
+
+class FakeTextChannel:
+    """Counts messages instead of sending them; each call costs `latency`."""
+
+    _ids = 0
+
+    def __init__(self, latency=0.05):
+        FakeTextChannel._ids += 1
+        self.id = FakeTextChannel._ids
+        self.latency = latency
+        self.sends = 0
+        self.edits = 0
+
+    async def send(self, content=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        self.sends += 1
+        return FakeMessage(self)
+
+
+class FakeVoiceChannel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.voice_client = None
+        self.text_channel = FakeTextChannel()
+
+    def get_channel(self, channel_id):
+        if channel_id == self.text_channel.id:
+            return self.text_channel
+        return None
+
+
+class FakeBot:
+    """The slice of commands.Bot that MusicCog and GuildMusic touch."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.guilds = []
+        self.latency = 0.05
+        self._cogs = {}
+
+    @property
+    def voice_clients(self):
+        return [guild.voice_client for guild in self.guilds if guild.voice_client]
+
+    def get_guild(self, guild_id):
+        return next((guild for guild in self.guilds if guild.id == guild_id), None)
+
+    def get_cog(self, name):
+        return self._cogs.get(name)
+
+    async def wait_until_ready(self):
+        return
+
+    def is_ready(self):
+        return True
+
+    def is_closed(self):
+        return False
@@ -0,0 +1,318 @@
+"""Offline load test: N simulated guilds driving MusicCog/GuildMusic.
+
+    python -m bench.run --guilds 50 --duration 60
+    python -m bench.run --guilds 50 --duration 60 --save before
+    python -m bench.run --guilds 50 --duration 60 --compare before
+
+Nothing talks to Discord, YouTube or Spotify: voice clients, text
+channels, yt-dlp and the Spotify client are replaced by the fakes in
+bench/fakes.py and bench/stubs.py. FFmpeg is used for real when it's
+installed (streaming generated test tracks over local HTTP); otherwise
+sources produce synthetic Opus frames and CPU figures exclude FFmpeg.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter, deque
+
+WORKDIR = tempfile.mkdtemp(prefix="musicbot-bench-")
+# Keep the bot's on-disk state out of the real cache directory. These are
+# read at import time, so they must be set before bot modules load.
+os.environ.setdefault("EXTRACT_CACHE_PATH", os.path.join(WORKDIR, "extract.db"))
+os.environ.setdefault("STATE_PATH", os.path.join(WORKDIR, "state.db"))
+os.environ.setdefault("SHARED_CACHE_PATH", os.path.join(WORKDIR, "shared.db"))
+os.environ.setdefault("SEARCH_INDEX_PATH", os.path.join(WORKDIR, "search.db"))
+os.environ.setdefault("EXTRACT_POOL", "thread")
+os.environ.pop("AUDIO_CACHE_DIR", None)
+
+import discord  # noqa: E402
+
+from bench.fakes import FakeBot, FakeGuild, FakeVoiceChannel, FakeVoiceClient, SyntheticAudio  # noqa: E402
+from bench.stubs import MediaServer, StubExtractor, StubSpotify  # noqa: E402
+from bot import player  # noqa: E402
+from bot.music_cog import MusicCog  # noqa: E402
+from bot.player import FILTER_PRESETS, YTDLSource  # noqa: E402
+from bot.procstat import rss_bytes  # noqa: E402
+from bot.timings import timings, percentile  # noqa: E402
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+
+# Relative weights of what a simulated guild does between pauses.
+COMMAND_MIX = {
+    'play': 50,
+    'skip': 20,
+    'skipto': 8,
+    'filter': 8,
+    'spotify_playlist': 3,
+    'youtube_playlist': 3,
+    'pause': 4,
+    'shuffle': 4,
+}
+FILTERS = [None] + [chain for chain, _ in FILTER_PRESETS.values()]
+
+# Metrics compared against baselines: (lower is better, smallest change
+# that counts, so millisecond jitter isn't reported as a regression).
+COMPARED = {
+    'tracks_per_s': (False, 0.05),
+    'start_p50': (True, 0.02),
+    'start_p95': (True, 0.05),
+    'gap_p50': (True, 0.02),
+    'gap_p95': (True, 0.05),
+    'extract_p95': (True, 0.05),
+    'loop_lag_p99': (True, 0.01),
+    'loop_lag_max': (True, 0.05),
+    'late_frame_pct': (True, 0.1),
+    'cpu_pct_per_stream': (True, 0.1),
+    'rss_kb_per_guild': (True, 50),
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30, help="seconds of simulated load")
+    parser.add_argument("--track-seconds", type=int, default=12, help="length of each test track")
+    parser.add_argument("--think", type=float, default=4, help="mean seconds between a guild's commands")
+    parser.add_argument("--catalog", type=int, default=300, help="distinct songs users ask for")
+    parser.add_argument("--extract-latency", type=float, default=0.8)
+    parser.add_argument("--extract-failures", type=float, default=0.0, help="fraction of failing extractions")
+    parser.add_argument("--playlist-size", type=int, default=200)
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed-up (frames per 20 ms)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-ffmpeg", action="store_true", help="use synthetic sources even if FFmpeg exists")
+    parser.add_argument("--save", metavar="NAME", help="store the results as a baseline")
+    parser.add_argument("--compare", metavar="NAME", help="compare against a stored baseline")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    return parser.parse_args(argv)
+
+
+class LagSampler:
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.samples = deque(maxlen=100000)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+
+async def guild_session(music, guild, rng, args, deadline, counts):
+    loop = asyncio.get_running_loop()
+    channel = guild.text_channel
+    actions, weights = zip(*COMMAND_MIX.items())
+    while loop.time() < deadline:
+        await asyncio.sleep(rng.expovariate(1 / args.think))
+        action = rng.choices(actions, weights)[0]
+        counts[action] += 1
+        if action == 'play':
+            query = f"song {rng.randrange(args.catalog)}"
+            loop.create_task(music.add_song(query, on_queued=lambda: music.request_play(channel)))
+        elif action == 'spotify_playlist':
+            url = f"https://open.spotify.com/playlist/bench{rng.randrange(20)}"
+            loop.create_task(music.add_song(url, on_queued=lambda: music.request_play(channel)))
+        elif action == 'youtube_playlist':
+            url = f"https://www.youtube.com/playlist?list=PLbench{rng.randrange(20)}"
+            loop.create_task(music.add_song(url, on_queued=lambda: music.request_play(channel)))
+        elif action == 'skip':
+            if music.current:
+                music.skip()
+        elif action == 'skipto':
+            if len(music.queue) > 1:
+                music.text_channel = channel
+                music.skip_to(rng.randint(1, min(len(music.queue), 20)))
+        elif action == 'filter':
+            music.set_filter(rng.choice(FILTERS))
+        elif action == 'pause':
+            vc = guild.voice_client
+            if vc and vc.is_paused():
+                vc.resume()
+            elif vc and vc.is_playing():
+                vc.pause()
+        elif action == 'shuffle':
+            music.queue.shuffle()
+            music.invalidate_prefetch()
+            music.schedule_prefetch()
+
+
+def install_stubs(args, media):
+    extractor = StubExtractor(
+        media, latency=args.extract_latency, failure_rate=args.extract_failures,
+    )
+    player.extract_track = extractor.extract_track
+    player.open_playlist = lambda url: extractor.open_playlist(url, args.playlist_size)
+    player.spotify = StubSpotify(size=args.playlist_size * 2)
+    if not media.ffmpeg:
+        discord.FFmpegOpusAudio = SyntheticAudio
+        discord.FFmpegPCMAudio = SyntheticAudio
+    return extractor
+
+
+def cpu_seconds():
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    loop = asyncio.get_running_loop()
+
+    media = MediaServer(WORKDIR, args.track_seconds)
+    if args.no_ffmpeg:
+        media.ffmpeg = False
+    await media.start()
+    extractor = install_stubs(args, media)
+
+    bot = FakeBot(loop)
+    cog = MusicCog(bot)
+    bot._cogs['MusicCog'] = cog
+    await cog.cog_load()
+
+    lag = LagSampler()
+    lag_task = loop.create_task(lag.run())
+    rss_before = rss_bytes() or 0
+
+    sessions = []
+    counts = Counter()
+    deadline = loop.time() + args.duration
+    cpu_start = cpu_seconds()
+    wall_start = time.perf_counter()
+    for index in range(args.guilds):
+        guild = FakeGuild(10_000 + index)
+        guild.voice_client = FakeVoiceClient(guild, FakeVoiceChannel(index), speed=args.speed)
+        bot.guilds.append(guild)
+        music = cog.get_music(guild)
+        sessions.append(guild_session(music, guild, random.Random(rng.random()), args, deadline, counts))
+
+    await asyncio.gather(*sessions)
+    wall = time.perf_counter() - wall_start
+    cpu = cpu_seconds() - cpu_start
+    rss_after = rss_bytes() or 0
+
+    voice = [guild.voice_client for guild in bot.guilds if guild.voice_client]
+    frames = sum(vc.frames_sent for vc in voice)
+    late = sum(vc.late_frames for vc in voice)
+    plays = sum(vc.plays for vc in voice)
+    stream_seconds = frames * 0.02 / args.speed
+    lag_samples = sorted(lag.samples)
+    stages = {stage: (n, p50, p95, p99) for stage, n, p50, p95, p99 in timings.summary()}
+    messages = sum(guild.text_channel.sends for guild in bot.guilds)
+    edits = sum(guild.text_channel.edits for guild in bot.guilds)
+
+    for music in list(cog.music_instances.values()):
+        music.close()
+    await asyncio.sleep(0.1)  # let the audio threads deliver their last after()
+    lag_task.cancel()
+    await cog.cog_unload()
+    await media.stop()
+
+    def stage(name, index):
+        return round(stages[name][index], 4) if name in stages else None
+
+    return {
+        'config': {
+            'guilds': args.guilds, 'duration': args.duration, 'track_seconds': args.track_seconds,
+            'think': args.think, 'extract_latency': args.extract_latency, 'speed': args.speed,
+            'ffmpeg': media.ffmpeg, 'seed': args.seed,
+        },
+        'commands': dict(counts),
+        'tracks_started': plays,
+        'tracks_per_s': round(plays / wall, 3),
+        'start_p50': stage('start', 1),
+        'start_p95': stage('start', 2),
+        'gap_p50': stage('gap', 1),
+        'gap_p95': stage('gap', 2),
+        'extract_p95': stage('extract', 2),
+        'stages': {name: {'n': v[0], 'p50': v[1], 'p95': v[2], 'p99': v[3]} for name, v in stages.items()},
+        'loop_lag_p50': round(percentile(lag_samples, 0.5) or 0, 4),
+        'loop_lag_p99': round(percentile(lag_samples, 0.99) or 0, 4),
+        'loop_lag_max': round(lag_samples[-1] if lag_samples else 0, 4),
+        'late_frame_pct': round(100 * late / frames, 3) if frames else 0,
+        'stream_seconds': round(stream_seconds, 1),
+        'cpu_seconds': round(cpu, 2),
+        'cpu_pct_per_stream': round(100 * cpu / stream_seconds, 3) if stream_seconds else None,
+        'rss_kb_per_guild': round((rss_after - rss_before) / 1024 / args.guilds, 1),
+        'rss_mb': round(rss_after / 1024 / 1024, 1),
+        'extractions': extractor.calls,
+        'extract_cache': YTDLSource.cache.stats(),
+        'extract_pool': YTDLSource.pool.stats(),
+        'messages_sent': messages,
+        'messages_edited': edits,
+    }
+
+
+def print_report(result):
+    config = result['config']
+    print(f"{config['guilds']} guilds for {config['duration']:g}s"
+          f" ({'FFmpeg' if config['ffmpeg'] else 'synthetic audio'}, speed x{config['speed']:g})")
+    print(f"  commands: {', '.join(f'{k}={v}' for k, v in sorted(result['commands'].items()))}")
+    print(f"  tracks started: {result['tracks_started']} ({result['tracks_per_s']}/s),"
+          f" extractions: {result['extractions']}, messages: {result['messages_sent']}"
+          f" sent / {result['messages_edited']} edited")
+    print(f"  {'stage':<13}{'n':>6}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for name, row in result['stages'].items():
+        print(f"  {name:<13}{row['n']:>6}{row['p50']:>8.3f}s{row['p95']:>8.3f}s{row['p99']:>8.3f}s")
+    print(f"  loop lag p50/p99/max: {result['loop_lag_p50']}/{result['loop_lag_p99']}/{result['loop_lag_max']}s")
+    print(f"  late frames: {result['late_frame_pct']}% of {result['stream_seconds']}s streamed")
+    print(f"  cpu: {result['cpu_seconds']}s total, {result['cpu_pct_per_stream']}% of a core per stream")
+    print(f"  memory: {result['rss_mb']} MB RSS, {result['rss_kb_per_guild']} KB per guild")
+
+
+def baseline_path(name):
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def compare(result, name):
+    with open(baseline_path(name)) as f:
+        base = json.load(f)
+    if base['config'] != result['config']:
+        print(f"  note: baseline config differs: {base['config']}")
+    print(f"  {'metric':<20}{'baseline':>12}{'current':>12}{'change':>10}")
+    worse = False
+    for metric, (lower_is_better, floor) in COMPARED.items():
+        old, new = base.get(metric), result.get(metric)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old * 100 if old else 0.0
+        worse_by = new - old if lower_is_better else old - new
+        regressed = worse_by > floor and abs(change) > 10
+        worse |= regressed
+        flag = "  <- worse" if regressed else ""
+        print(f"  {metric:<20}{old:>12}{new:>12}{change:>+9.1f}%{flag}")
+    return worse
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        result = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(baseline_path(args.save), 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"Saved baseline {baseline_path(args.save)}")
+    if args.compare:
+        print(f"Compared with {args.compare}:")
+        if compare(result, args.compare):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+import asyncio
+import hashlib
+import os
+import random
+import shutil
+import subprocess
+import time
+
+from aiohttp import web
+
+FAR_EXPIRY = 4102444800  # 2100-01-01, so stub stream URLs never go stale
+
+
+def video_id(query):
+    return hashlib.sha1(query.encode()).hexdigest()[:11]
+
+
+class MediaServer:
+    """Serves generated test tracks over local HTTP, so FFmpeg streams them
+    with the same -reconnect input options it uses for YouTube."""
+
+    def __init__(self, directory, duration):
+        self.directory = directory
+        self.duration = duration
+        self.ffmpeg = shutil.which('ffmpeg') is not None
+        self.port = None
+        self._runner = None
+
+    def generate(self):
+        if not self.ffmpeg:
+            return
+        path = os.path.join(self.directory, 'track.ogg')
+        if not os.path.exists(path):
+            subprocess.run(
+                ['ffmpeg', '-nostdin', '-loglevel', 'error', '-f', 'lavfi',
+                 '-i', f"sine=frequency=440:duration={self.duration}",
+                 '-c:a', 'libopus', '-b:a', '96k', '-ar', '48000', '-ac', '2', path],
+                check=True,
+            )
+
+    async def start(self):
+        self.generate()
+        app = web.Application()
+        app.router.add_static('/', self.directory)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def url(self):
+        return (f"http://127.0.0.1:{self.port}/track.ogg"
+                f"?d={self.duration}&expire={FAR_EXPIRY}")
+
+
+class StubExtractor:
+    """Replaces the yt-dlp calls the pool runs, with configurable latency.
+
+    Runs in the real ExtractionPool workers, so queueing, single-flight and
+    the extraction cache behave exactly as in production.
+    """
+
+    def __init__(self, media, latency=0.8, jitter=0.5, failure_rate=0.0, page_latency=0.3):
+        self.media = media
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.page_latency = page_latency
+        self.calls = 0
+
+    def _sleep(self, seconds):
+        time.sleep(seconds * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def extract_track(self, query):
+        self.calls += 1
+        self._sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise RuntimeError("yt-dlp extract_info failed: stub failure")
+        vid = video_id(query)
+        return {
+            'id': vid,
+            'title': f"Stub {query}",
+            'url': self.media.url(),
+            'webpage_url': f"https://www.youtube.com/watch?v={vid}",
+            'duration': self.media.duration,
+            'acodec': 'opus',
+            'asr': 48000,
+        }
+
+    def open_playlist(self, url, size=200):
+        self._sleep(self.latency)
+
+        def entries():
+            for index in range(size):
+                if index and index % 100 == 0:
+                    self._sleep(self.page_latency)  # YouTube pages 100 at a time
+                yield {'id': video_id(f"{url}#{index}"), 'title': f"Playlist track {index}",
+                       'duration': self.media.duration}
+
+        return "Stub playlist", entries()
+
+
+class StubSpotify:
+    """iter_tracks with Spotify's page sizes and a per-page delay."""
+
+    def __init__(self, size=500, page=100, page_latency=0.25):
+        self.size = size
+        self.page = page
+        self.page_latency = page_latency
+
+    async def iter_tracks(self, url):
+        for start in range(0, self.size, self.page):
+            await asyncio.sleep(self.page_latency)
+            yield [(f"{url} artist song {index}", None)
+                   for index in range(start, min(start + self.page, self.size))]
+
+    async def close(self):
+        return
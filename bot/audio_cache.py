@@ -0,0 +1,201 @@
+import asyncio
+import json
+import os
+from collections import OrderedDict
+
+import discord
+from discord.oggparse import OggStream
+
+from bot.loudness import gain_filter
+
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR")  # unset disables the cache
+AUDIO_CACHE_MAX_MB = int(os.getenv("AUDIO_CACHE_MAX_MB", "2048"))
+AUDIO_CACHE_MIN_PLAYS = int(os.getenv("AUDIO_CACHE_MIN_PLAYS", "3"))
+
+FILL_CONCURRENCY = 2  # background FFmpeg downloads at once
+MAX_TRACKED_PLAYS = 20000  # play counters kept before the coldest are dropped
+SAVE_DELAY = 30
+READ_BUFFER = 64 * 1024
+FRAME_SECONDS = 0.02  # one Opus packet
+
+
+class CachedOpusAudio(discord.AudioSource):
+    """Plays a cached Ogg/Opus file straight to Discord, no FFmpeg involved."""
+
+    def __init__(self, path, *, start_time=None):
+        self._file = open(path, 'rb', buffering=READ_BUFFER)
+        self._packets = OggStream(self._file).iter_packets()
+        skip = int((start_time or 0) / FRAME_SECONDS)
+        for _ in range(skip):
+            if not self._next_audio_packet():
+                break
+
+    def _next_audio_packet(self):
+        for packet in self._packets:
+            # OpusHead/OpusTags are stream headers, not audio.
+            if not packet.startswith((b'OpusHead', b'OpusTags')):
+                return packet
+        return b''
+
+    def read(self):
+        return self._next_audio_packet()
+
+    def is_opus(self):
+        return True
+
+    def cleanup(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+class AudioCache:
+    """Size-bounded LRU directory of ready-to-send Ogg/Opus files.
+
+    Tracks are only cached once they've been played AUDIO_CACHE_MIN_PLAYS
+    times, so one-off requests don't churn the disk.
+    """
+
+    def __init__(self, directory=AUDIO_CACHE_DIR, max_bytes=AUDIO_CACHE_MAX_MB * 1024 * 1024,
+                 min_plays=AUDIO_CACHE_MIN_PLAYS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_plays = min_plays
+        self._files = OrderedDict()  # video id -> size, least recently used first
+        self._total = 0
+        self._plays = {}
+        self._pending = set()
+        self._semaphore = None
+        self._save_handle = None
+        self.hits = 0
+        self.fills = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._scan()
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def _path(self, video_id):
+        return os.path.join(self.directory, f"{video_id}.ogg")
+
+    def _scan(self):
+        found = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.part'):
+                os.remove(path)  # interrupted fill
+            elif name.endswith('.ogg'):
+                stat = os.stat(path)
+                found.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, video_id, size in sorted(found):
+            self._files[video_id] = size
+            self._total += size
+        try:
+            with open(os.path.join(self.directory, 'plays.json')) as f:
+                self._plays = json.load(f)
+        except (OSError, ValueError):
+            self._plays = {}
+
+    def __contains__(self, video_id):
+        return self.enabled and video_id in self._files
+
+    def lookup(self, video_id):
+        """Path of the cached file for video_id, or None."""
+        if not self.enabled or video_id not in self._files:
+            return None
+        path = self._path(video_id)
+        if not os.path.exists(path):
+            self._total -= self._files.pop(video_id)
+            return None
+        self._files.move_to_end(video_id)
+        os.utime(path)  # mtime keeps the LRU order across restarts
+        self.hits += 1
+        return path
+
+    def record_play(self, data, gain=0.0):
+        """Count a play and start a background fill once a track is popular.
+
+        gain (dB) is baked into the cached file; None means the track's
+        loudness isn't known yet, so the fill waits for a later play.
+        """
+        video_id = data.get('id')
+        if not self.enabled or not video_id:
+            return
+        plays = self._plays.get(video_id, 0) + 1
+        self._plays[video_id] = plays
+        self._schedule_save()
+        if (plays >= self.min_plays and video_id not in self._files
+                and video_id not in self._pending and data.get('url') and gain is not None):
+            self._pending.add(video_id)
+            asyncio.ensure_future(self._fill(video_id, data, gain))
+
+    async def _fill(self, video_id, data, gain=0.0):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(FILL_CONCURRENCY)
+        path = self._path(video_id)
+        tmp = f"{path}.part"
+        volume = gain_filter(gain)
+        copy = not volume and data.get('acodec') == 'opus' and data.get('asr', 48000) == 48000
+        codec = ('-c:a', 'copy') if copy else ('-c:a', 'libopus', '-b:a', '128k', '-ar', '48000', '-ac', '2')
+        if volume:
+            codec = ('-af', volume, *codec)
+        try:
+            async with self._semaphore:
+                proc = await asyncio.create_subprocess_exec(
+                    'ffmpeg', '-nostdin', '-loglevel', 'error',
+                    '-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5',
+                    '-i', data['url'], '-vn', '-map_metadata', '-1', *codec, '-f', 'ogg', tmp,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE,
+                )
+                _, stderr = await proc.communicate()
+            if proc.returncode != 0:
+                print(f"[audio cache] fill failed for {video_id}: {stderr.decode(errors='ignore').strip()}")
+                return
+            os.replace(tmp, path)
+            size = os.path.getsize(path)
+            self._files[video_id] = size
+            self._total += size
+            self.fills += 1
+            self._evict()
+        except Exception as e:
+            print(f"[audio cache] fill failed for {video_id}: {e}")
+        finally:
+            self._pending.discard(video_id)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _evict(self):
+        while self._total > self.max_bytes and self._files:
+            video_id, size = self._files.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(self._path(video_id))
+            except OSError:
+                pass
+
+    def _schedule_save(self):
+        if self._save_handle is None:
+            loop = asyncio.get_running_loop()
+            self._save_handle = loop.call_later(SAVE_DELAY, self._save)
+
+    def _save(self):
+        self._save_handle = None
+        if len(self._plays) > MAX_TRACKED_PLAYS:
+            keep = sorted(self._plays.items(), key=lambda item: item[1], reverse=True)
+            self._plays = dict(keep[:MAX_TRACKED_PLAYS // 2])
+        try:
+            with open(os.path.join(self.directory, 'plays.json'), 'w') as f:
+                json.dump(self._plays, f)
+        except OSError as e:
+            print(f"[audio cache] could not save play counts: {e}")
+
+    def stats(self):
+        return {
+            'files': len(self._files),
+            'bytes': self._total,
+            'hits': self.hits,
+            'fills': self.fills,
+            'pending': len(self._pending),
+        }
@@ -0,0 +1,344 @@
+import json
+import os
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
+
+CACHE_PATH = os.getenv("EXTRACT_CACHE_PATH", "cache/extract.db")
+CACHE_MAX_ENTRIES = int(os.getenv("EXTRACT_CACHE_MAX_ENTRIES", "5000"))
+CACHE_DISK_ENTRIES = int(os.getenv("EXTRACT_CACHE_DISK_ENTRIES", str(CACHE_MAX_ENTRIES * 4)))
+DISK_TRIM_EVERY = 200  # puts between disk size checks
+
+METADATA_TTL = 7 * 24 * 3600  # titles, ids and durations rarely change
+STREAM_TTL = 3 * 3600  # used when the stream URL carries no expire= hint
+STREAM_EXPIRY_MARGIN = 10 * 60  # don't hand out a URL that dies mid-song
+
+# The only parts of a yt-dlp info dict the bot reads. Everything else
+# (formats, thumbnails lists, subtitles...) is dropped before caching.
+KEEP_FIELDS = (
+    'id', 'title', 'url', 'webpage_url', 'thumbnail', 'duration', 'uploader', 'acodec', 'asr',
+)
+
+_YT_ID = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+
+def youtube_id(query):
+    """Return the video id for a YouTube URL, or None."""
+    if not query.startswith(('http://', 'https://')):
+        return None
+    parsed = urlparse(query)
+    host = parsed.netloc.lower()
+    if host.endswith('youtu.be'):
+        vid = parsed.path.lstrip('/').split('/')[0]
+    elif 'youtube.com' in host:
+        if parsed.path.startswith(('/shorts/', '/embed/', '/live/')):
+            vid = parsed.path.split('/')[2]
+        else:
+            vid = parse_qs(parsed.query).get('v', [''])[0]
+    else:
+        return None
+    return vid if _YT_ID.match(vid) else None
+
+
+def youtube_playlist_id(query):
+    """Return the list= id for a YouTube playlist or mix URL, or None."""
+    if not query.startswith(('http://', 'https://')):
+        return None
+    parsed = urlparse(query)
+    host = parsed.netloc.lower()
+    if 'youtube.com' not in host and not host.endswith('youtu.be'):
+        return None
+    return parse_qs(parsed.query).get('list', [None])[0]
+
+
+def normalize_key(query):
+    vid = youtube_id(query)
+    if vid:
+        return f"yt:{vid}"
+    if query.startswith(('http://', 'https://')):
+        return query.strip()
+    return "q:" + " ".join(query.lower().split())
+
+
+def trim_info(data):
+    return {k: data[k] for k in KEEP_FIELDS if data.get(k) is not None}
+
+
+def stream_expiry(url, now):
+    """When a resolved stream URL stops working, from its expire= hint."""
+    parsed = urlparse(url)
+    expire = parse_qs(parsed.query).get('expire', [None])[0]
+    if expire is None:
+        # HLS/DASH manifests put it in the path: .../expire/1700000000/...
+        parts = parsed.path.split('/')
+        if 'expire' in parts:
+            idx = parts.index('expire')
+            if idx + 1 < len(parts):
+                expire = parts[idx + 1]
+    try:
+        return float(expire) - STREAM_EXPIRY_MARGIN
+    except (TypeError, ValueError):
+        return now + STREAM_TTL
+
+
+def open_sqlite(path, timeout=5, **kwargs):
+    """Connect to the SQLite file at path, creating its directory, in WAL mode.
+
+    Every on-disk store uses this: WAL lets the processes of a cluster read
+    while one writes, and with it synchronous=NORMAL only risks the last
+    commits on a power cut, never corruption.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    db = sqlite3.connect(path, timeout=timeout, **kwargs)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+
+class SQLiteWriter:
+    """A store's writes, committed in order on a thread of their own.
+
+    In cluster mode every worker writes the same files, so a commit can
+    wait out another process's lock for the whole busy timeout; on the
+    event loop that would stall playback. submit() returns at once and
+    reads keep using the store's own connection.
+    """
+
+    def __init__(self, path, name):
+        self.name = name  # log prefix
+        self._db = open_sqlite(path, check_same_thread=False)
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=name.replace(' ', '-') + "-writer"
+        )
+
+    def submit(self, step, *args):
+        """Run step(db, *args) in a transaction; failures are logged."""
+        try:
+            self._executor.submit(self._run, step, args)
+        except RuntimeError:
+            pass  # closed, or the interpreter is shutting down
+
+    def _run(self, step, args):
+        try:
+            with self._db:
+                step(self._db, *args)
+        except sqlite3.Error as e:
+            print(f"[{self.name}] write failed: {e}")
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._db.close()
+
+
+class ExtractionCache:
+    """LRU cache of trimmed yt-dlp results, shared by all guilds.
+
+    Entries are reachable both by the query that produced them and by the
+    video id, so a search and a direct link to the same video share one
+    extraction. Metadata and stream URLs expire separately: a stale stream
+    can still be re-resolved from its webpage_url without a search.
+
+    The in-memory LRU is a front for the SQLite file, which holds more
+    entries and is shared by every process of a cluster: a memory miss
+    checks the file before counting as a miss. The file is LRU too: hits
+    bump last_used, batched into the next write instead of a commit each.
+    Writes go through a SQLiteWriter, off the event loop.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=CACHE_MAX_ENTRIES,
+                 disk_entries=CACHE_DISK_ENTRIES):
+        self.max_entries = max_entries
+        self.disk_entries = max(disk_entries, max_entries)
+        self._entries = OrderedDict()  # key -> (data, meta_expires, stream_expires)
+        self._touched = {}  # key -> last hit not yet written to disk
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+        self._db = None
+        self._writer = None
+        if path:
+            try:
+                self._db = self._open(path)
+                self._load()
+                self._writer = SQLiteWriter(path, 'cache')
+            except sqlite3.Error as e:
+                print(f"[cache] disk store unavailable, running in memory: {e}")
+                self._db = None
+
+    def _open(self, path):
+        db = open_sqlite(path)
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS extractions ("
+            " key TEXT PRIMARY KEY, data TEXT NOT NULL,"
+            " meta_expires REAL NOT NULL, stream_expires REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        return db
+
+    def _load(self):
+        now = time.time()
+        self._db.execute("DELETE FROM extractions WHERE meta_expires <= ?", (now,))
+        self._db.commit()
+        rows = self._db.execute(
+            "SELECT key, data, meta_expires, stream_expires FROM extractions"
+            " ORDER BY last_used DESC LIMIT ?",
+            (self.max_entries,),
+        ).fetchall()
+        for key, data, meta_expires, stream_expires in reversed(rows):
+            self._entries[key] = (json.loads(data), meta_expires, stream_expires)
+
+    def _lookup(self, query):
+        key = normalize_key(query)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._read(key)
+            if entry is None:
+                return None
+            self._remember(key, entry)
+        now = time.time()
+        if entry[1] <= now:
+            self._discard(key)
+            return None
+        self._entries.move_to_end(key)
+        if self._db:
+            self._touched[key] = now
+            if len(self._touched) >= DISK_TRIM_EVERY:
+                self._write(None)  # a read-mostly cache still keeps its order
+        return entry
+
+    def _read(self, key):
+        """Fetch one entry from disk, e.g. one another worker just stored."""
+        if not self._db:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT data, meta_expires, stream_expires FROM extractions WHERE key = ?",
+                (key,),
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"[cache] read failed: {e}")
+            return None
+        return (json.loads(row[0]), row[1], row[2]) if row else None
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, query):
+        """Return cached info with a still-valid stream URL, or None."""
+        entry = self._lookup(query)
+        if entry is None:
+            self.misses += 1
+            return None
+        data, _, stream_expires = entry
+        if stream_expires <= time.time():
+            self.stale += 1
+            return None
+        self.hits += 1
+        return dict(data)
+
+    def metadata(self, query):
+        """Return cached info even if its stream URL has expired."""
+        entry = self._lookup(query)
+        return dict(entry[0]) if entry else None
+
+    def expire_stream(self, query):
+        """Mark a cached stream URL dead, e.g. after FFmpeg failed on it."""
+        entry = self._lookup(query)
+        if entry:
+            data, meta_expires, _ = entry
+            keys = [k for k in {normalize_key(query), f"yt:{data.get('id')}"} if k in self._entries]
+            for key in keys:
+                self._entries[key] = (data, meta_expires, 0)
+            if self._db:
+                self._write(self._expire_streams, keys)
+
+    def put(self, query, data):
+        data = trim_info(data)
+        now = time.time()
+        entry = (data, now + METADATA_TTL, stream_expiry(data.get('url', ''), now))
+
+        keys = {normalize_key(query)}
+        if data.get('id'):
+            keys.add(f"yt:{data['id']}")
+        for key in keys:
+            self._remember(key, entry)
+
+        if self._db:
+            for key in keys:
+                self._touched.pop(key, None)
+            self._puts += 1
+            trim = self.disk_entries if self._puts % DISK_TRIM_EVERY == 0 else None
+            self._write(self._store_entry, keys, data, entry, now, trim)
+        return data
+
+    def _write(self, step, *args):
+        """Queue step(db, *args), together with the hits since the last write."""
+        touched, self._touched = self._touched, {}
+        self._writer.submit(self._write_with_hits, touched, step, args)
+
+    def _discard(self, key):
+        self._entries.pop(key, None)
+        if self._db:
+            self._touched.pop(key, None)
+            self._write(self._delete_entry, key)
+
+    # Write steps, run on the SQLiteWriter's thread.
+
+    def _write_with_hits(self, db, touched, step, args):
+        db.executemany(
+            "UPDATE extractions SET last_used = ? WHERE key = ?",
+            [(used, key) for key, used in touched.items()],
+        )
+        if step:
+            step(db, *args)
+
+    def _store_entry(self, db, keys, data, entry, now, trim):
+        value = json.dumps(data)  # encoded here rather than on the event loop
+        db.executemany(
+            "INSERT OR REPLACE INTO extractions VALUES (?, ?, ?, ?, ?)",
+            [(key, value, entry[1], entry[2], now) for key in keys],
+        )
+        if trim:
+            db.execute(
+                "DELETE FROM extractions WHERE key NOT IN ("
+                " SELECT key FROM extractions ORDER BY last_used DESC LIMIT ?)",
+                (trim,),
+            )
+
+    def _expire_streams(self, db, keys):
+        db.executemany(
+            "UPDATE extractions SET stream_expires = 0 WHERE key = ?", [(k,) for k in keys]
+        )
+
+    def _delete_entry(self, db, key):
+        db.execute("DELETE FROM extractions WHERE key = ?", (key,))
+
+    def close(self):
+        """Write pending hits and wait for queued writes."""
+        if self._writer is not None:
+            if self._touched:
+                self._write(None)
+            self._writer.close()
+            self._writer = None
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale': self.stale,
+        }
+
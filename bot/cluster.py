@@ -0,0 +1,155 @@
+"""Cluster mode: a supervisor that runs the bot as several processes.
+
+    python -m bot.cluster
+
+Each worker is a normal `python main.py` that owns a contiguous range of
+shards (SHARD_IDS / SHARD_COUNT in its environment), so gateway events,
+voice encoding and yt-dlp parsing spread across cores. Workers that exit
+are restarted with exponential backoff. The extraction and Spotify caches
+live in SQLite files every worker opens, so they're shared.
+
+The supervisor serves /healthz and /readyz on PORT; worker N serves its own
+health and /metrics on PORT + 1 + N.
+"""
+import asyncio
+import os
+import signal
+import sys
+import time
+
+import aiohttp
+from dotenv import load_dotenv
+
+from bot import metrics
+from keep_alive import keep_alive
+
+CLUSTER_WORKERS = int(os.getenv("CLUSTER_WORKERS", str(os.cpu_count() or 1)))
+SHARD_COUNT = os.getenv("SHARD_COUNT")  # unset asks Discord for its recommendation
+
+GATEWAY_URL = "https://discord.com/api/v10/gateway/bot"
+IDENTIFY_INTERVAL = 5  # Discord allows max_concurrency IDENTIFYs per 5 seconds
+RESTART_BACKOFF_MIN = 1
+RESTART_BACKOFF_MAX = 60
+STABLE_AFTER = 300  # a worker that ran this long starts over at the minimum backoff
+
+
+def shard_ranges(shard_count, workers):
+    """Split shards 0..shard_count-1 into at most `workers` contiguous ranges."""
+    workers = max(1, min(workers, shard_count))
+    size, extra = divmod(shard_count, workers)
+    ranges = []
+    start = 0
+    for index in range(workers):
+        end = start + size + (1 if index < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+async def gateway_info(token):
+    """(recommended shard count, identify max_concurrency) from Discord."""
+    headers = {'Authorization': f"Bot {token}"}
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=20)) as session:
+        async with session.get(GATEWAY_URL, headers=headers) as resp:
+            if resp.status != 200:
+                raise RuntimeError(f"GET /gateway/bot failed ({resp.status}).")
+            payload = await resp.json()
+    limit = payload.get('session_start_limit', {})
+    return payload['shards'], limit.get('max_concurrency', 1)
+
+
+class Worker:
+    def __init__(self, index, shard_ids, shard_count, workers, start_delay=0):
+        self.index = index
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.workers = workers
+        self.start_delay = start_delay
+        self.process = None
+        self.restarts = 0
+        self._stopping = False
+
+    def _env(self):
+        env = dict(os.environ)
+        env['SHARD_IDS'] = ",".join(map(str, self.shard_ids))
+        env['SHARD_COUNT'] = str(self.shard_count)
+        env['CLUSTER_WORKER'] = str(self.index)
+        env['CLUSTER_WORKERS'] = str(self.workers)  # splits per-host limits, e.g. FFmpeg's
+        return env
+
+    async def run(self):
+        await asyncio.sleep(self.start_delay)
+        backoff = RESTART_BACKOFF_MIN
+        while not self._stopping:
+            started = time.monotonic()
+            self.process = await asyncio.create_subprocess_exec(
+                sys.executable, "main.py", env=self._env()
+            )
+            print(f"[cluster] worker {self.index} (shards {self.shard_ids[0]}-{self.shard_ids[-1]})"
+                  f" started as pid {self.process.pid}")
+            code = await self.process.wait()
+            if self._stopping:
+                return
+            if time.monotonic() - started >= STABLE_AFTER:
+                backoff = RESTART_BACKOFF_MIN
+            self.restarts += 1
+            print(f"[cluster] worker {self.index} exited with {code}; restarting in {backoff}s")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, RESTART_BACKOFF_MAX)
+
+    def stop(self):
+        self._stopping = True
+        if self.process and self.process.returncode is None:
+            self.process.terminate()
+
+
+async def supervise():
+    load_dotenv()
+    token = os.getenv("DISCORD_TOKEN")
+    max_concurrency = 1
+    if SHARD_COUNT:
+        shard_count = int(SHARD_COUNT)
+    else:
+        shard_count, max_concurrency = await gateway_info(token)
+
+    # Later workers wait until the earlier ones have identified all their
+    # shards, so the cluster as a whole respects the IDENTIFY rate limit.
+    workers = []
+    delay = 0
+    ranges = shard_ranges(shard_count, CLUSTER_WORKERS)
+    for index, shard_ids in enumerate(ranges):
+        workers.append(Worker(index, shard_ids, shard_count, len(ranges), start_delay=delay))
+        delay += len(shard_ids) * IDENTIFY_INTERVAL / max_concurrency
+    print(f"[cluster] {shard_count} shards across {len(workers)} workers")
+
+    metrics.gauge(
+        "cluster_workers_running", "Worker processes currently alive.",
+        fn=lambda: sum(1 for w in workers if w.process and w.process.returncode is None),
+    )
+    metrics.counter(
+        "cluster_worker_restarts_total", "Worker restarts after a crash or exit.",
+        fn=lambda: [({'worker': w.index}, w.restarts) for w in workers],
+    )
+
+    def health(_):
+        running = sum(1 for w in workers if w.process and w.process.returncode is None)
+        details = {'workers': len(workers), 'running': running}
+        return True, running == len(workers), details
+
+    await keep_alive(health=health)
+    tasks = [asyncio.create_task(worker.run()) for worker in workers]
+
+    def shutdown():
+        for worker, task in zip(workers, tasks):
+            worker.stop()
+            if worker.process is None or worker.process.returncode is not None:
+                task.cancel()  # still waiting to start or to restart
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, shutdown)
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(supervise())
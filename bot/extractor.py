@@ -0,0 +1,282 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+
+from bot import metrics
+from bot.cache import trim_info
+
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "4"))
+EXTRACT_POOL = os.getenv("EXTRACT_POOL", "thread")  # "thread" or "process"
+EXTRACT_TIMEOUT = float(os.getenv("EXTRACT_TIMEOUT", "30"))
+
+PRIORITY_PLAY = 0  # someone is waiting on this to start playing
+PRIORITY_PREFETCH = 1  # background work, runs only when no play job is queued
+
+YTDL_OPTIONS = {
+    'format': 'bestaudio/best',
+    'quiet': True,
+    'default_search': 'ytsearch',
+    'noplaylist': True
+}
+
+# Playlist listing only: entries come back as id/title/duration stubs and are
+# pulled page by page from YouTube as the generator is consumed.
+FLAT_OPTIONS = {
+    **YTDL_OPTIONS,
+    'noplaylist': False,
+    'extract_flat': 'in_playlist',
+    'lazy_playlist': True,
+}
+UNAVAILABLE_TITLES = ('[Private video]', '[Deleted video]')
+PLAYLIST_BATCH = 50
+MAX_PLAYLIST_TRACKS = int(os.getenv("MAX_PLAYLIST_TRACKS", "5000"))
+
+_local = threading.local()
+
+EXTRACT_SECONDS = metrics.histogram(
+    "extract_seconds", "Time a yt-dlp job spent running in a worker.",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60),
+)
+EXTRACT_WAIT_SECONDS = metrics.histogram(
+    "extract_queue_wait_seconds", "Time a yt-dlp job waited for a free worker.",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30),
+)
+
+
+def extract_track(query):
+    """Resolve query to a single track's info dict. Runs inside a pool worker.
+
+    Each worker thread (or process) keeps its own YoutubeDL instance, since
+    they aren't safe to share between threads.
+    """
+    ytdl = _get_ytdl('ytdl', YTDL_OPTIONS)
+    try:
+        data = ytdl.extract_info(query, download=False)
+    except Exception as e:
+        raise RuntimeError(f"yt-dlp extract_info failed: {e}")
+
+    if not data:
+        raise RuntimeError("yt-dlp returned no data.")
+
+    if 'entries' in data:
+        entries = list(data['entries'] or [])
+        if not entries:
+            raise RuntimeError("yt-dlp returned no results.")
+        data = entries[0]
+
+    if not data.get('url'):
+        raise RuntimeError("No playable URL found in yt-dlp data.")
+
+    # Drop formats/subtitles/etc. here so a process pool doesn't pickle them.
+    return trim_info(data)
+
+
+def _new_ytdl(options):
+    # yt-dlp is slow to import and large; only pay for it once the first
+    # extraction runs, inside the worker that needs it.
+    import yt_dlp
+
+    return yt_dlp.YoutubeDL(options)
+
+
+def _get_ytdl(name, options):
+    ytdl = getattr(_local, name, None)
+    if ytdl is None:
+        ytdl = _new_ytdl(options)
+        setattr(_local, name, ytdl)
+    return ytdl
+
+
+def open_playlist(url):
+    """Start a flat listing of a playlist or mix; returns (title, entries).
+
+    entries is a lazy iterator, so it only works with the thread pool. Its
+    pages are fetched by whichever pool thread runs next_entries, so the
+    listing gets a YoutubeDL of its own rather than sharing a thread's.
+    """
+    ytdl = _new_ytdl(FLAT_OPTIONS)
+    try:
+        info = ytdl.extract_info(url, download=False, process=False)
+        # watch?v=...&list=... resolves to a redirect to the playlist itself.
+        for _ in range(3):
+            if not info or info.get('_type') not in ('url', 'url_transparent'):
+                break
+            info = ytdl.extract_info(
+                info['url'], download=False, process=False, ie_key=info.get('ie_key')
+            )
+    except Exception as e:
+        raise RuntimeError(f"yt-dlp playlist listing failed: {e}")
+
+    if not info or info.get('entries') is None:
+        raise RuntimeError("Not a playlist.")
+    return info.get('title'), iter(info['entries'])
+
+
+def next_entries(entries, count):
+    """Pull up to count playable stubs off a listing; (batch, exhausted)."""
+    batch = []
+    pulled = 0
+    try:
+        for entry in islice(entries, count):
+            pulled += 1
+            if not entry or not entry.get('id') or entry.get('title') in UNAVAILABLE_TITLES:
+                continue
+            batch.append({
+                'id': entry['id'],
+                'title': entry.get('title'),
+                'duration': entry.get('duration'),
+            })
+    except Exception as e:
+        raise RuntimeError(f"yt-dlp playlist listing failed: {e}")
+    return batch, pulled < count
+
+
+class _Job:
+    __slots__ = ('fn', 'args', 'guild_id', 'priority', 'future', 'queued_at', 'local')
+
+    def __init__(self, fn, args, guild_id, priority, future, local):
+        self.fn = fn
+        self.args = args
+        self.guild_id = guild_id
+        self.priority = priority
+        self.future = future
+        self.queued_at = time.monotonic()
+        self.local = local
+
+
+class ExtractionPool:
+    """Bounded worker pool for yt-dlp calls.
+
+    Jobs wait in one queue per priority; inside a priority, guilds are served
+    round-robin so a guild with many pending jobs can't starve the rest.
+    """
+
+    def __init__(self, workers=EXTRACT_WORKERS, kind=EXTRACT_POOL, timeout=EXTRACT_TIMEOUT):
+        self.workers = workers
+        self.kind = kind
+        self.timeout = timeout
+        self._executor = None
+        self._thread_executor = None
+        self._queues = (OrderedDict(), OrderedDict())  # per priority: guild -> deque
+        self._queued = 0
+        self._running = 0
+        self._waits = deque(maxlen=512)
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+
+    def _get_executor(self, local=False):
+        if self.kind == "process" and not local:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+        if self._thread_executor is None:
+            self._thread_executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="extract"
+            )
+        return self._thread_executor
+
+    def submit(self, fn, *args, guild_id=None, priority=PRIORITY_PLAY, local=False):
+        """Queue fn(*args); the returned job's future holds the result.
+
+        local=True keeps the job on a thread even in process mode, for work
+        on objects that can't cross a process boundary.
+        """
+        loop = asyncio.get_running_loop()
+        job = _Job(fn, args, guild_id, priority, loop.create_future(), local)
+        self._queues[priority].setdefault(guild_id, deque()).append(job)
+        self._queued += 1
+        self._pump()
+        return job
+
+    async def run(self, fn, *args, guild_id=None, priority=PRIORITY_PLAY, local=False):
+        job = self.submit(fn, *args, guild_id=guild_id, priority=priority, local=local)
+        return await job.future
+
+    def promote(self, job, priority=PRIORITY_PLAY):
+        """Move a still-queued job up, e.g. a prefetch someone now waits on."""
+        if job.priority <= priority:
+            return
+        pending = self._queues[job.priority].get(job.guild_id)
+        if not pending or job not in pending:
+            return
+        pending.remove(job)
+        if not pending:
+            del self._queues[job.priority][job.guild_id]
+        job.priority = priority
+        self._queues[priority].setdefault(job.guild_id, deque()).append(job)
+
+    def _next_job(self):
+        for queues in self._queues:
+            while queues:
+                guild_id, pending = next(iter(queues.items()))
+                job = pending.popleft()
+                if pending:
+                    queues.move_to_end(guild_id)
+                else:
+                    del queues[guild_id]
+                self._queued -= 1
+                if not job.future.done():  # skip jobs whose caller gave up
+                    return job
+        return None
+
+    def _pump(self):
+        while self._running < self.workers:
+            job = self._next_job()
+            if job is None:
+                return
+            self._running += 1
+            wait = time.monotonic() - job.queued_at
+            self._waits.append(wait)
+            EXTRACT_WAIT_SECONDS.observe(wait)
+            asyncio.ensure_future(self._execute(job))
+
+    async def _execute(self, job):
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        work = loop.run_in_executor(self._get_executor(job.local), job.fn, *job.args)
+        work.add_done_callback(lambda _: EXTRACT_SECONDS.observe(time.monotonic() - started))
+        try:
+            result = await asyncio.wait_for(asyncio.shield(work), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            if not job.future.done():
+                job.future.set_exception(
+                    RuntimeError(f"Extraction timed out after {self.timeout:g}s.")
+                )
+            # A worker can't be interrupted; keep its slot until it really
+            # finishes so the concurrency bound stays honest.
+            try:
+                await work
+            except Exception:
+                pass
+        except Exception as e:
+            self.failed += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            self.completed += 1
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._running -= 1
+            self._pump()
+
+    def stats(self):
+        waits = sorted(self._waits)
+        return {
+            'workers': self.workers,
+            'running': self._running,
+            'queued': self._queued,
+            'queued_play': sum(len(q) for q in self._queues[PRIORITY_PLAY].values()),
+            'queued_prefetch': sum(len(q) for q in self._queues[PRIORITY_PREFETCH].values()),
+            'wait_avg': sum(waits) / len(waits) if waits else 0.0,
+            'wait_max': waits[-1] if waits else 0.0,
+            'completed': self.completed,
+            'failed': self.failed,
+            'timeouts': self.timeouts,
+        }
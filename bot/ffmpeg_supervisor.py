@@ -0,0 +1,237 @@
+import asyncio
+import os
+import subprocess
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from bot import metrics
+from bot.procstat import cpu_seconds, rss_bytes
+
+# Concurrent playback FFmpeg processes per host. New tracks wait for a slot
+# rather than oversubscribing the CPU, so stream density stays predictable.
+FFMPEG_MAX_PROCESSES = int(os.getenv("FFMPEG_MAX_PROCESSES", str((os.cpu_count() or 1) * 16)))
+# Every cluster worker runs its own supervisor, so each gets an equal share
+# of the host's cap. The cluster sets both variables; a standalone bot has it all.
+CLUSTER_WORKERS = int(os.getenv("CLUSTER_WORKERS", "1")) if os.getenv("CLUSTER_WORKER") else 1
+WORKER_MAX_PROCESSES = max(1, FFMPEG_MAX_PROCESSES // CLUSTER_WORKERS)
+SUPERVISOR_INTERVAL = 10  # seconds between sweeps
+STALL_SECONDS = float(os.getenv("FFMPEG_STALL_SECONDS", "30"))
+STALL_CPU = 0.05  # CPU seconds a stalled process may still burn per sweep
+TERM_GRACE = 1.0  # seconds FFmpeg gets to exit on SIGTERM before it is killed
+REAPER_THREADS = 4
+
+REAPED = metrics.counter("ffmpeg_reaped_total", "FFmpeg processes killed by the supervisor, by reason.")
+SLOT_WAIT_SECONDS = metrics.histogram(
+    "ffmpeg_slot_wait_seconds", "Time a track waited for an FFmpeg slot.",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30),
+)
+
+
+def ffmpeg_process(source):
+    """The Popen behind a discord.py FFmpeg source, or None for other sources."""
+    source = getattr(source, 'original', source)  # PCMVolumeTransformer
+    process = getattr(source, '_process', None)
+    return process if isinstance(process, subprocess.Popen) else None
+
+
+class _Child:
+    __slots__ = (
+        'process', 'owner', 'guild_id', 'started', 'cpu', 'rss', 'frames', 'progress_at',
+        'progress_cpu', 'unclaimed', 'stopping',
+    )
+
+    def __init__(self, process, owner, guild_id):
+        self.process = process
+        self.owner = weakref.ref(owner)
+        self.guild_id = guild_id
+        self.started = time.monotonic()
+        self.cpu = 0.0
+        self.rss = 0
+        self.frames = 0
+        self.progress_at = self.started
+        self.progress_cpu = 0.0
+        self.unclaimed = 0
+        self.stopping = None  # when the termination handshake started
+
+
+class FFmpegSupervisor:
+    """Every playback FFmpeg process the bot has running, per guild.
+
+    - adopt() registers a source's process as it is spawned; slot() makes
+      callers wait while this process is at its share of FFMPEG_MAX_PROCESSES.
+    - release() replaces discord.py's inline kill: SIGTERM, a short grace
+      period, then SIGKILL and reaping on a worker thread. The slot is only
+      given back once the process has actually exited.
+    - A sweep samples CPU time and RSS from /proc, kills processes whose
+      source stopped producing audio (stuck in -reconnect), and reaps ones
+      no player holds any more.
+    """
+
+    def __init__(self, max_processes=WORKER_MAX_PROCESSES):
+        self.max_processes = max_processes
+        self.owners = None  # guild id -> GuildMusic (or None), set by MusicCog
+        self._children = {}  # pid -> _Child
+        self._lock = threading.Lock()
+        self._reaper = ThreadPoolExecutor(REAPER_THREADS, thread_name_prefix="ffmpeg-reaper")
+        self._loop = None
+        self._room = None
+        self._task = None
+        self.cpu_total = 0.0  # CPU seconds of every process seen, live or gone
+
+    @property
+    def running(self):
+        return len(self._children)
+
+    def has_room(self):
+        return len(self._children) < self.max_processes
+
+    async def slot(self):
+        """Wait until another FFmpeg process may be started."""
+        if self.has_room():
+            return
+        waited = time.perf_counter()
+        while not self.has_room():
+            self._room.clear()
+            await self._room.wait()
+        SLOT_WAIT_SECONDS.observe(time.perf_counter() - waited)
+
+    def adopt(self, owner, guild_id=None):
+        """Track the FFmpeg process feeding owner (a YTDLSource), if it has one."""
+        process = ffmpeg_process(owner.source)
+        if process is None:
+            return
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._room = asyncio.Event()
+            self._task = self._loop.create_task(self._run())
+        with self._lock:
+            self._children[process.pid] = _Child(process, owner, guild_id)
+
+    def release(self, owner, reason=None):
+        """Stop owner's process off the event loop; safe from any thread."""
+        process = ffmpeg_process(owner.source)
+        with self._lock:
+            child = self._children.get(process.pid) if process else None
+            if child is None or child.stopping is not None:
+                child = None
+            else:
+                child.stopping = time.monotonic()
+        if child is None:
+            self._submit(owner.source.cleanup)
+            return
+        if reason:
+            REAPED.inc(reason=reason)
+        self._submit(self._terminate, owner.source, child)
+
+    def _submit(self, fn, *args):
+        try:
+            self._reaper.submit(fn, *args)
+        except RuntimeError:
+            fn(*args)  # interpreter shutting down, the reaper threads are gone
+
+    def _terminate(self, source, child):
+        process = child.process
+        if process.poll() is None:
+            try:
+                process.terminate()  # lets FFmpeg close its connections cleanly
+                process.wait(TERM_GRACE)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+        try:
+            source.cleanup()  # discord.py closes the pipes and SIGKILLs a holdout
+        except Exception as e:
+            print(f"[ffmpeg] cleanup of {process.pid} failed: {e}")
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        self._forget(child)
+
+    def _forget(self, child):
+        with self._lock:
+            if self._children.get(child.process.pid) is child:
+                del self._children[child.process.pid]
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            try:
+                loop.call_soon_threadsafe(self._room.set)
+            except RuntimeError:
+                pass  # loop shut down meanwhile
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(SUPERVISOR_INTERVAL)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"[ffmpeg] sweep failed: {e}")
+
+    def sweep(self):
+        now = time.monotonic()
+        with self._lock:
+            children = list(self._children.values())
+        for child in children:
+            pid = child.process.pid
+            if child.stopping is not None:
+                continue
+            if child.process.poll() is not None:
+                # Exited (track over, or killed as stalled); release() reaps
+                # it when its source is cleaned up, or now if nothing will.
+                if child.owner() is None:
+                    self._forget(child)
+                continue
+            cpu = cpu_seconds(pid)
+            if cpu is not None:
+                self.cpu_total += max(0.0, cpu - child.cpu)
+                child.cpu = cpu
+                child.rss = rss_bytes(pid) or 0
+
+            owner = child.owner()
+            if owner is None:
+                # The source was dropped without cleanup(); nothing will ever
+                # read from or stop this process.
+                REAPED.inc(reason='orphaned')
+                child.stopping = now
+                self._submit(self._kill, child)
+                continue
+
+            music = self.owners(child.guild_id) if self.owners else None
+            use = music.source_state(owner) if music else None
+            if use is None and self.owners:
+                # Neither playing nor warmed for any player, two sweeps running.
+                child.unclaimed += 1
+                if child.unclaimed >= 2:
+                    self.release(owner, reason='orphaned')
+                continue
+            child.unclaimed = 0
+
+            if use != 'playing' or owner.frames != child.frames:
+                child.frames = owner.frames
+                child.progress_at = now
+                child.progress_cpu = child.cpu
+            elif now - child.progress_at >= STALL_SECONDS and child.cpu - child.progress_cpu < STALL_CPU:
+                # No audio and no work: stuck reconnecting. Killing it ends
+                # the track early, and the player resumes it from a fresh URL.
+                print(f"[ffmpeg] process {pid} in guild {child.guild_id} stalled, killing it")
+                REAPED.inc(reason='stalled')
+                child.progress_at = now
+                try:
+                    child.process.kill()
+                except OSError:
+                    pass
+
+    def _kill(self, child):
+        try:
+            child.process.kill()
+            child.process.wait()
+        except OSError:
+            pass
+        self._forget(child)
+
+    def usage(self, guild_id=None):
+        """(processes, CPU seconds, RSS bytes) of live processes, for one guild or all."""
+        with self._lock:
+            children = [c for c in self._children.values()
+                        if guild_id is None or c.guild_id == guild_id]
+        return len(children), sum(c.cpu for c in children), sum(c.rss for c in children)
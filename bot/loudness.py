@@ -0,0 +1,159 @@
+import asyncio
+import os
+import re
+import shutil
+import sqlite3
+import time
+from collections import OrderedDict
+
+from bot.cache import CACHE_PATH, SQLiteWriter, open_sqlite
+
+LOUDNESS_NORMALIZE = os.getenv("LOUDNESS_NORMALIZE", "1") == "1"
+LOUDNESS_TARGET = float(os.getenv("LOUDNESS_TARGET", "-14"))  # LUFS, what streaming services aim for
+MAX_GAIN = 12.0  # dB either way; beyond this the measurement is more likely wrong than the track
+# Gains smaller than this aren't applied, so tracks already near the target
+# keep the Opus passthrough (no decode/encode in FFmpeg).
+GAIN_THRESHOLD = float(os.getenv("LOUDNESS_GAIN_THRESHOLD", "1.5"))
+SILENCE_LUFS = -60  # quieter than this is a silent track or a failed read; leave it alone
+
+ANALYZE_CONCURRENCY = 2  # background FFmpeg measurements at once
+ANALYZE_TIMEOUT = 300
+MEMORY_ENTRIES = 5000
+
+_INTEGRATED = re.compile(r"I:\s+(-?\d+(?:\.\d+)?) LUFS")
+
+
+class LoudnessAnalyzer:
+    """Integrated loudness per video, measured once in the background.
+
+    FFmpeg's ebur128 filter reads the whole track off the main path (after
+    a prefetch or the first play). The result is stored next to the
+    extraction cache in its SQLite file, and later plays get a static
+    volume gain in their existing -af chain instead of per-frame scaling.
+    """
+
+    def __init__(self, path=CACHE_PATH, target=LOUDNESS_TARGET):
+        self.target = target
+        self.enabled = LOUDNESS_NORMALIZE and shutil.which('ffmpeg') is not None
+        self._known = OrderedDict()  # video id -> LUFS, recently used last
+        self._pending = set()
+        self._semaphore = None
+        self.measured = 0
+        self._db = None
+        self._writer = None
+        if self.enabled and path:
+            try:
+                self._db = self._open(path)
+                self._writer = SQLiteWriter(path, 'loudness')
+            except sqlite3.Error as e:
+                print(f"[loudness] disk store unavailable, running in memory: {e}")
+                self._db = None
+
+    def _open(self, path):
+        db = open_sqlite(path)
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS loudness ("
+            " video_id TEXT PRIMARY KEY, lufs REAL NOT NULL, measured REAL NOT NULL)"
+        )
+        db.commit()
+        return db
+
+    def _lufs(self, video_id):
+        if video_id in self._known:
+            self._known.move_to_end(video_id)
+            return self._known[video_id]
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT lufs FROM loudness WHERE video_id = ?", (video_id,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"[loudness] read failed: {e}")
+            return None
+        if row is None:
+            return None
+        self._remember(video_id, row[0])
+        return row[0]
+
+    def _remember(self, video_id, lufs):
+        self._known[video_id] = lufs
+        self._known.move_to_end(video_id)
+        while len(self._known) > MEMORY_ENTRIES:
+            self._known.popitem(last=False)
+
+    def gain(self, video_id):
+        """dB to apply to video_id: None until it's been measured, 0 if disabled."""
+        if not self.enabled:
+            return 0.0
+        lufs = self._lufs(video_id) if video_id else None
+        if lufs is None:
+            return None
+        if lufs < SILENCE_LUFS:
+            return 0.0
+        return max(-MAX_GAIN, min(MAX_GAIN, self.target - lufs))
+
+    def analyze(self, data, path=None):
+        """Measure the track in data in the background, unless it's known.
+
+        path is a local copy to read instead of the stream URL.
+        """
+        video_id = data.get('id')
+        source = path or data.get('url')
+        if (not self.enabled or not video_id or not source or video_id in self._pending
+                or self._lufs(video_id) is not None):
+            return
+        self._pending.add(video_id)
+        asyncio.ensure_future(self._measure(video_id, source, local=path is not None))
+
+    async def _measure(self, video_id, source, local):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(ANALYZE_CONCURRENCY)
+        reconnect = () if local else (
+            '-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5',
+        )
+        proc = None
+        try:
+            async with self._semaphore:
+                proc = await asyncio.create_subprocess_exec(
+                    'ffmpeg', '-nostdin', '-hide_banner', '-nostats', *reconnect,
+                    '-i', source, '-vn', '-af', 'ebur128=framelog=quiet', '-f', 'null', '-',
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE,
+                )
+                _, stderr = await asyncio.wait_for(proc.communicate(), ANALYZE_TIMEOUT)
+            # The last I: line is the summary for the whole track.
+            found = _INTEGRATED.findall(stderr.decode(errors='ignore'))
+            if proc.returncode != 0 or not found:
+                print(f"[loudness] could not measure {video_id}")
+                return
+            self._store(video_id, float(found[-1]))
+        except asyncio.TimeoutError:
+            print(f"[loudness] measuring {video_id} timed out")
+            proc.kill()
+            await proc.wait()
+        except Exception as e:
+            print(f"[loudness] measuring {video_id} failed: {e}")
+        finally:
+            self._pending.discard(video_id)
+
+    def _store(self, video_id, lufs):
+        self._remember(video_id, lufs)
+        self.measured += 1
+        if self._db is None:
+            return
+        self._writer.submit(
+            lambda db: db.execute(
+                "INSERT OR REPLACE INTO loudness VALUES (?, ?, ?)", (video_id, lufs, time.time())
+            )
+        )
+
+    def stats(self):
+        return {'known': len(self._known), 'measured': self.measured, 'pending': len(self._pending)}
+
+
+def gain_filter(gain):
+    """-af fragment for gain in dB, or None when it isn't worth applying."""
+    if gain is None or abs(gain) < GAIN_THRESHOLD:
+        return None
+    return f"volume={gain:.1f}dB"
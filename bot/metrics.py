@@ -0,0 +1,160 @@
+import asyncio
+import math
+from bisect import bisect_left
+
+# A tiny Prometheus text-format registry: enough for a handful of counters,
+# gauges and histograms without pulling in prometheus_client.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LOOP_LAG_INTERVAL = 0.5
+
+_registry = {}
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in items) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, fn=None):
+        self.name = name
+        self.help = help_text
+        self._fn = fn
+        self._values = {}
+
+    def set_function(self, fn):
+        """Read the value(s) at scrape time: fn() returns a number or a
+        list of (labels dict, number)."""
+        self._fn = fn
+
+    def _samples(self):
+        if self._fn is None:
+            return list(self._values.items())
+        result = self._fn()
+        if isinstance(result, (int, float)):
+            return [((), result)]
+        return [(_label_key(labels), value) for labels, value in result]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in self._samples():
+            lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        self._values[_label_key(labels)] = value
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels))
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = (('le', _format_value(bound)),)
+                lines.append(f"{self.name}_bucket{_format_labels(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+def _register(cls, name, *args, **kwargs):
+    metric = _registry.get(name)
+    if metric is None:
+        metric = _registry[name] = cls(name, *args, **kwargs)
+    return metric
+
+
+def counter(name, help_text, fn=None):
+    return _register(Counter, name, help_text, fn=fn)
+
+
+def gauge(name, help_text, fn=None):
+    return _register(Gauge, name, help_text, fn=fn)
+
+
+def histogram(name, help_text, buckets=DEFAULT_BUCKETS):
+    return _register(Histogram, name, help_text, buckets=buckets)
+
+
+def render():
+    lines = []
+    for metric in _registry.values():
+        try:
+            lines.extend(metric.render())
+        except Exception as e:
+            print(f"[metrics] {metric.name}: {e}")
+    return "\n".join(lines) + "\n"
+
+
+LOOP_LAG = gauge("event_loop_lag_last_seconds", "Last measured event loop scheduling delay.")
+LOOP_LAG_HIST = histogram(
+    "event_loop_lag_seconds", "Event loop scheduling delay.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+
+
+async def _probe_loop_lag(interval):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+        LOOP_LAG.set(lag)
+        LOOP_LAG_HIST.observe(lag)
+
+
+def start_loop_lag_probe(interval=LOOP_LAG_INTERVAL):
+    """Measure how late a sleep(interval) wakes up; a busy loop shows up here
+    long before audio starts stuttering."""
+    return asyncio.ensure_future(_probe_loop_lag(interval))
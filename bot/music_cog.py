@@ -1,22 +1,188 @@
 import discord
 import asyncio
-from discord.ext import commands
+import os
+import time
+from discord.ext import commands, tasks
 from discord import app_commands
-from bot.player import GuildMusic
+from bot import metrics
+from bot.player import GuildMusic, YTDLSource, FILTER_PRESETS, IDLE
+from bot.procstat import rss_bytes
+from bot.profiler import profiler
+from bot.queue_view import QueueView, MAX_QUEUE_PAGE
+from bot.search_index import CHOICE_LENGTH
+from bot.spotify import spotify
+from bot.state_store import StateStore, STATE_FLUSH_SECONDS
+from bot.timings import timings
 
-MAX_QUEUE_PAGE = 10  # number of songs per embed page
 MAX_COMMANDS_PAGE = 10  # number of commands per page
 
+IDLE_DISCONNECT_MINUTES = float(os.getenv("IDLE_DISCONNECT_MINUTES", "5"))
+IDLE_EVICT_MINUTES = float(os.getenv("IDLE_EVICT_MINUTES", "30"))
+IDLE_SWEEP_SECONDS = 60
+
 
 class MusicCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.music_instances = {}  # Store GuildMusic per guild
+        self.store = StateStore()
+        self._sessions_resumed = False
+
+    async def cog_load(self):
+        self.idle_sweep.start()
+        self.persist_state.start()
+        # Lets the FFmpeg supervisor tell live processes from orphans.
+        YTDLSource.supervisor.owners = self.music_instances.get
+        self._register_metrics()
+
+    async def cog_unload(self):
+        self.idle_sweep.cancel()
+        self.persist_state.cancel()
+        await self.store.flush(list(self.music_instances.values()))
+        self.store.close()
 
     def get_music(self, guild):
-        if guild.id not in self.music_instances:
-            self.music_instances[guild.id] = GuildMusic(self.bot, guild)
-        return self.music_instances[guild.id]
+        music = self.music_instances.get(guild.id)
+        if music is None:
+            music = GuildMusic(self.bot, guild)
+            state = self.store.load(guild.id)
+            if state:
+                music.restore(state)
+            self.music_instances[guild.id] = music
+        return music
+
+    def _register_metrics(self):
+        """Gauges read at scrape time, so nothing is updated on the hot path."""
+        bot = self.bot
+        players = self.music_instances
+
+        def pool_jobs():
+            stats = YTDLSource.pool.stats()
+            return [({'state': state}, stats[state])
+                    for state in ('running', 'queued_play', 'queued_prefetch')]
+
+        def pool_results():
+            stats = YTDLSource.pool.stats()
+            return [({'result': result}, stats[result])
+                    for result in ('completed', 'failed', 'timeouts')]
+
+        def cache_requests():
+            extract = YTDLSource.cache.stats()
+            shared = spotify.cache.stats()
+            return [
+                ({'cache': 'extract', 'result': 'hit'}, extract['hits']),
+                ({'cache': 'extract', 'result': 'miss'}, extract['misses']),
+                ({'cache': 'extract', 'result': 'stale'}, extract['stale']),
+                ({'cache': 'audio', 'result': 'hit'}, YTDLSource.audio_cache.hits),
+                ({'cache': 'spotify', 'result': 'hit'}, shared['hits']),
+                ({'cache': 'spotify', 'result': 'miss'}, shared['misses']),
+                ({'cache': 'search_index', 'result': 'hit'}, YTDLSource.search_index.hits),
+                ({'cache': 'search_index', 'result': 'miss'}, YTDLSource.search_index.misses),
+            ]
+
+        def ffmpeg_processes():
+            return [
+                ({'kind': 'playback'}, YTDLSource.ffmpeg_running),
+                ({'kind': 'cache_fill'}, YTDLSource.audio_cache.stats()['pending']),
+                ({'kind': 'loudness'}, YTDLSource.loudness.stats()['pending']),
+            ]
+
+        supervisor = YTDLSource.supervisor
+
+        metrics.gauge("discord_guilds", "Guilds this process serves.",
+                      fn=lambda: len(bot.guilds))
+        metrics.gauge("voice_connections", "Connected voice clients.",
+                      fn=lambda: sum(1 for vc in bot.voice_clients if vc.is_connected()))
+        metrics.gauge("music_players", "GuildMusic instances in memory.",
+                      fn=lambda: len(players))
+        metrics.gauge("music_players_active", "Players loading or playing a track.",
+                      fn=lambda: sum(1 for music in players.values() if music.state != IDLE))
+        metrics.gauge("music_queue_tracks", "Tracks queued across all guilds.",
+                      fn=lambda: sum(len(music.queue) for music in players.values()))
+        metrics.gauge("music_queue_tracks_max", "Longest queue of any guild.",
+                      fn=lambda: max((len(music.queue) for music in players.values()), default=0))
+        metrics.gauge("extract_pool_jobs", "yt-dlp jobs by state.", fn=pool_jobs)
+        metrics.counter("extract_jobs_total", "Finished yt-dlp jobs by result.", fn=pool_results)
+        metrics.counter("cache_requests_total", "Cache lookups by cache and result.",
+                        fn=cache_requests)
+        metrics.gauge("ffmpeg_processes", "FFmpeg processes currently running.",
+                      fn=ffmpeg_processes)
+        metrics.gauge("ffmpeg_supervised_processes", "Playback FFmpeg processes alive, stopping included.",
+                      fn=lambda: supervisor.running)
+        metrics.gauge("ffmpeg_max_processes", "Cap on concurrent playback FFmpeg processes.",
+                      fn=lambda: supervisor.max_processes)
+        metrics.counter("ffmpeg_cpu_seconds_total", "CPU time used by playback FFmpeg processes.",
+                        fn=lambda: supervisor.cpu_total)
+        metrics.gauge("ffmpeg_resident_memory_bytes", "Resident memory of playback FFmpeg processes.",
+                      fn=lambda: supervisor.usage()[2])
+        metrics.gauge("process_resident_memory_bytes", "Resident memory of this process.",
+                      fn=lambda: rss_bytes() or 0)
+
+    # ---------------- Idle lifecycle ----------------
+
+    @tasks.loop(seconds=IDLE_SWEEP_SECONDS)
+    async def idle_sweep(self):
+        """Leave voice after IDLE_DISCONNECT_MINUTES, drop state after IDLE_EVICT_MINUTES."""
+        now = time.monotonic()
+        for guild_id, music in list(self.music_instances.items()):
+            if not music.is_idle:
+                music.touch()
+                continue
+            idle = now - music.last_active
+            vc = music.guild.voice_client
+            if vc:
+                if idle >= IDLE_DISCONNECT_MINUTES * 60:
+                    music.park()
+                    try:
+                        await vc.disconnect()
+                    except Exception as e:
+                        print(f"[lifecycle] disconnect failed in guild {guild_id}: {e}")
+                    print(f"[lifecycle] left voice in guild {guild_id} after {idle / 60:.0f} idle minutes")
+            elif idle >= IDLE_EVICT_MINUTES * 60:
+                await self._evict(guild_id, music)
+
+    @idle_sweep.before_loop
+    async def before_idle_sweep(self):
+        await self.bot.wait_until_ready()
+
+    async def _evict(self, guild_id, music):
+        music.close()
+        if music.queue and not self.store.enabled:
+            return  # compacted above; the queue itself stays in memory
+        touched = music.last_active
+        if not await self.store.save(music) or music.last_active != touched:
+            return  # not saved, or someone used the guild meanwhile
+        if self.music_instances.get(guild_id) is music:
+            del self.music_instances[guild_id]
+            self.store.forget(guild_id)
+
+    # ---------------- Durable state ----------------
+
+    @tasks.loop(seconds=STATE_FLUSH_SECONDS)
+    async def persist_state(self):
+        await self.store.flush(list(self.music_instances.values()))
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # on_ready fires again after every gateway reconnect; resume once.
+        if self._sessions_resumed:
+            return
+        self._sessions_resumed = True
+        for guild_id, voice_id, text_id, position in self.store.sessions():
+            guild = self.bot.get_guild(guild_id)
+            channel = guild and guild.get_channel(voice_id)
+            if channel is None or guild.voice_client:
+                continue
+            music = self.get_music(guild)
+            if not music.queue:
+                continue
+            try:
+                await channel.connect()
+            except Exception as e:
+                print(f"[state] could not rejoin voice in guild {guild_id}: {e}")
+                continue
+            music.resume(position, guild.get_channel(text_id) if text_id else None)
+            print(f"[state] resumed guild {guild_id} at {position:.0f}s")
 
     async def join_vc(self, interaction):
         """Join the user's voice channel if not already."""
@@ -44,18 +210,29 @@ class MusicCog(commands.Cog):
 
         await interaction.response.send_message(f"✅ Queuing: {query}")
 
-        # Queue songs asynchronously
-        asyncio.create_task(music.add_song(query))
-
-        vc = interaction.guild.voice_client
-        if vc is None or not vc.is_playing():
-            asyncio.create_task(music.play_next(text_channel=interaction.channel))
+        # Queue songs asynchronously; playback starts as soon as the first
+        # one is queued rather than after a whole playlist has loaded.
+        asyncio.create_task(music.add_song(
+            query, on_queued=lambda: music.request_play(interaction.channel)
+        ))
+
+    @play_slash.autocomplete("query")
+    async def play_autocomplete(self, interaction: discord.Interaction, current: str):
+        # Answered from the local index only: songs played here before.
+        choices = []
+        for _, title, duration in YTDLSource.search_index.search(current):
+            name = title
+            if duration:
+                minutes, seconds = divmod(int(duration), 60)
+                name = f"{title[:CHOICE_LENGTH - 10]} ({minutes}:{seconds:02d})"
+            choices.append(app_commands.Choice(name=name[:CHOICE_LENGTH], value=title[:CHOICE_LENGTH]))
+        return choices
 
     @app_commands.command(name="skip", description="Skip the current song")
     async def skip_slash(self, interaction: discord.Interaction):
         vc = interaction.guild.voice_client
         if vc and vc.is_playing():
-            vc.stop()
+            self.get_music(interaction.guild).skip()
             await interaction.response.send_message("⏭️ Skipped current song.")
         else:
             await interaction.response.send_message("Nothing is playing.", ephemeral=True)
@@ -65,7 +242,6 @@ class MusicCog(commands.Cog):
     )
     async def skipto_slash(self, interaction: discord.Interaction, index: int):
         music = self.get_music(interaction.guild)
-        vc = interaction.guild.voice_client
 
         await interaction.response.defer(thinking=True)
 
@@ -74,8 +250,7 @@ class MusicCog(commands.Cog):
             return
 
         if music.loop_song:
-            if vc and vc.is_playing():
-                vc.stop()
+            music.skip()
             await interaction.followup.send(
                 "Looping current song; skipto ignored.", ephemeral=True
             )
@@ -87,19 +262,8 @@ class MusicCog(commands.Cog):
             )
             return
 
-        target_pos = index - 1
-        skipped_songs = music.queue[:target_pos]
-        music.queue = music.queue[target_pos:]
-
-        if music.loop_queue:
-            music.queue += skipped_songs
-
-        music.manual_skip = True
-        if vc and vc.is_playing():
-            vc.stop()
-
-        await music.play_next(text_channel=interaction.channel)
-        music.manual_skip = False
+        music.text_channel = interaction.channel
+        music.skip_to(index)
 
         await interaction.followup.send(f"⏭️ Skipped to song {index} in the queue.")
 
@@ -111,53 +275,18 @@ class MusicCog(commands.Cog):
             await interaction.response.send_message("The queue is currently empty.")
             return
 
-        await interaction.response.defer(thinking=True)
-
-        # Build queue pages
-        pages = []
-        for i in range(0, len(music.queue), MAX_QUEUE_PAGE):
-            chunk = music.queue[i : i + MAX_QUEUE_PAGE]
-            description = ""
-            for j, (title, filter_name) in enumerate(chunk, start=i + 1):
-                if filter_name:
-                    description += f"{j}. **{title}** — `{filter_name}`\n"
-                else:
-                    description += f"{j}. **{title}**\n"
-            embed = discord.Embed(
-                title=f"Queue (songs {i+1}-{min(i+MAX_QUEUE_PAGE,len(music.queue))})",
-                description=description,
-                color=discord.Color.blurple(),
-            )
-            pages.append(embed)
-
-        # Send first page with buttons if multiple pages
-        if len(pages) == 1:
-            await interaction.followup.send(embed=pages[0])
-            return
-
-        current_page = 0
-
-        class QueueView(discord.ui.View):
-            def __init__(self):
-                super().__init__(timeout=120)
-                self.page = 0
-
-            @discord.ui.button(label="Previous", style=discord.ButtonStyle.primary)
-            async def prev(self, interaction_button, button):
-                self.page = max(0, self.page - 1)
-                await interaction_button.response.edit_message(embed=pages[self.page])
-
-            @discord.ui.button(label="Next", style=discord.ButtonStyle.primary)
-            async def next(self, interaction_button, button):
-                self.page = min(len(pages) - 1, self.page + 1)
-                await interaction_button.response.edit_message(embed=pages[self.page])
-
-        await interaction.followup.send(embed=pages[0], view=QueueView())
+        view = QueueView(music.queue)
+        embed = view.first_page()
+        if len(music.queue) <= MAX_QUEUE_PAGE:
+            await interaction.response.send_message(embed=embed)
+        else:
+            await interaction.response.send_message(embed=embed, view=view)
 
     @app_commands.command(name="clearqueue", description="Clear the song queue")
     async def clearqueue_slash(self, interaction: discord.Interaction):
         music = self.get_music(interaction.guild)
         music.queue.clear()
+        music.invalidate_prefetch()
         await interaction.response.send_message("🗑️ Queue cleared.")
 
     @app_commands.command(
@@ -166,7 +295,7 @@ class MusicCog(commands.Cog):
     async def stop_slash(self, interaction: discord.Interaction):
         music = self.get_music(interaction.guild)
 
-        await music.stop(interaction)
+        music.stop()
 
         vc = interaction.guild.voice_client
         if vc:
@@ -184,7 +313,7 @@ class MusicCog(commands.Cog):
         vc = interaction.guild.voice_client
         if music.current and vc and vc.source:
             title = getattr(vc.source, "title", None)
-            per_song_filter = music.current[1] if isinstance(music.current, tuple) else None
+            per_song_filter = music.current.filters
             active_filter = per_song_filter if per_song_filter is not None else music.global_filter
             embed = discord.Embed(
                 title="🎶 Now Playing",
@@ -198,10 +327,10 @@ class MusicCog(commands.Cog):
 
     @app_commands.command(name="shuffle", description="Shuffle the queue")
     async def shuffle_slash(self, interaction: discord.Interaction):
-        import random
-
         music = self.get_music(interaction.guild)
-        random.shuffle(music.queue)
+        music.queue.shuffle()
+        music.invalidate_prefetch()
+        music.schedule_prefetch()
         await interaction.response.send_message("🔀 Queue shuffled.")
 
     @app_commands.command(
@@ -212,6 +341,8 @@ class MusicCog(commands.Cog):
         music.loop_song = not music.loop_song
         if music.loop_song:
             music.loop_queue = False
+        if music.current:
+            music.schedule_prefetch()  # the next track is now a different one
         await interaction.response.send_message(
             f"Loop song is now {'on' if music.loop_song else 'off'}."
         )
@@ -224,10 +355,22 @@ class MusicCog(commands.Cog):
         music.loop_queue = not music.loop_queue
         if music.loop_queue:
             music.loop_song = False
+        if music.current:
+            music.schedule_prefetch()
         await interaction.response.send_message(
             f"Loop queue is now {'on' if music.loop_queue else 'off'}."
         )
 
+    @app_commands.command(
+        name="autoplay", description="Toggle playing related songs when the queue runs out"
+    )
+    async def autoplay_slash(self, interaction: discord.Interaction):
+        music = self.get_music(interaction.guild)
+        music.set_autoplay(not music.autoplay)
+        await interaction.response.send_message(
+            f"Autoplay is now {'on' if music.autoplay else 'off'}."
+        )
+
     @app_commands.command(
         name="filter",
         description="Apply a filter to the current song (or all songs if global)",
@@ -241,34 +384,14 @@ class MusicCog(commands.Cog):
         ]
     )
     async def filter_slash(self, interaction: discord.Interaction, filter_name: str):
-        filters = {
-            "nightcore": "asetrate=48000*1.25,aresample=48000,atempo=1.1,aformat=channel_layouts=stereo,acompressor=threshold=0.5:ratio=2:attack=200:release=1000",
-            "daycore": "asetrate=48000*0.8,aresample=48000,atempo=0.9,aformat=channel_layouts=stereo,acompressor=threshold=0.5:ratio=2:attack=200:release=1000",
-            "vaporwave": "asetrate=44100*0.8,aresample=44100,atempo=0.9,aformat=channel_layouts=stereo,acompressor=threshold=0.5:ratio=2:attack=200:release=1000",
-            "none": None
-        }
-
         music = self.get_music(interaction.guild)
-        chosen_filter = filters.get(filter_name, None)
+        chosen_filter = FILTER_PRESETS[filter_name][0] if filter_name in FILTER_PRESETS else None
 
-        music.global_filter = chosen_filter
-
-        if music.current:
-            if chosen_filter is None:
-                music.force_filter = "RESET_FILTER"
-            else:
-                music.force_filter = chosen_filter
+        # The current song is re-spawned in place at its current position.
+        music.set_filter(chosen_filter)
 
         await interaction.response.send_message(f"Global filter set to `{filter_name}`.")
 
-        vc = interaction.guild.voice_client
-        if vc and vc.is_playing():
-            music.replaying = True
-            vc.stop()
-            await asyncio.sleep(0.2)
-            await music.play_next(text_channel=interaction.channel)
-            music.replaying = False
-
     # ---------------- New Commands ----------------
 
     @app_commands.command(
@@ -290,6 +413,63 @@ class MusicCog(commands.Cog):
             await interaction.response.send_message("Nothing is playing.", ephemeral=True)
 
 
+    # ---------------- Admin Commands ----------------
+
+    @app_commands.command(
+        name="timings", description="Show p50/p95/p99 times for each stage of starting a song"
+    )
+    @app_commands.default_permissions(administrator=True)
+    @app_commands.choices(
+        scope=[
+            discord.app_commands.Choice(name="This server", value="guild"),
+            discord.app_commands.Choice(name="All servers", value="all"),
+        ]
+    )
+    async def timings_slash(self, interaction: discord.Interaction, scope: str = "guild"):
+        rows = timings.summary(interaction.guild.id if scope == "guild" else None)
+        if not rows:
+            await interaction.response.send_message("No timings recorded yet.", ephemeral=True)
+            return
+        lines = [f"{'stage':<13}{'n':>6}{'p50':>9}{'p95':>9}{'p99':>9}"]
+        for stage, count, p50, p95, p99 in rows:
+            lines.append(f"{stage:<13}{count:>6}{p50:>8.2f}s{p95:>8.2f}s{p99:>8.2f}s")
+        processes, cpu, rss = YTDLSource.supervisor.usage(
+            interaction.guild.id if scope == "guild" else None
+        )
+        lines.append(f"ffmpeg: {processes} running, {cpu:.1f}s CPU, {rss / 2**20:.0f} MB RSS")
+        body = "\n".join(lines)
+        await interaction.response.send_message(f"```\n{body}\n```", ephemeral=True)
+
+    @app_commands.command(
+        name="profiler", description="Start or stop the event loop sampling profiler"
+    )
+    @app_commands.default_permissions(administrator=True)
+    @app_commands.choices(
+        action=[
+            discord.app_commands.Choice(name="Start", value="start"),
+            discord.app_commands.Choice(name="Stop and report", value="stop"),
+            discord.app_commands.Choice(name="Status", value="status"),
+        ]
+    )
+    async def profiler_slash(self, interaction: discord.Interaction, action: str):
+        if action == "start":
+            started = profiler.start()  # sample this thread: the event loop
+            message = "Profiler started." if started else "Profiler is already running."
+        elif action == "stop":
+            if not profiler.stop():
+                message = "Profiler is not running."
+            else:
+                path = await self.bot.loop.run_in_executor(None, profiler.dump)
+                top = "\n".join(f"{share:6.1%}  {name}" for share, name in profiler.top())
+                message = (
+                    f"{profiler.samples} samples, collapsed stacks in `{path}`.\n"
+                    f"```\n{top or 'no samples'}\n```"
+                )
+        else:
+            state = "running" if profiler.running else "stopped"
+            message = f"Profiler is {state} ({profiler.samples} samples)."
+        await interaction.response.send_message(message[:2000], ephemeral=True)
+
     @app_commands.command(
         name="commands",
         description="Show all available music commands"
@@ -306,6 +486,7 @@ class MusicCog(commands.Cog):
             ("shuffle", "Shuffle the queue"),
             ("loop_song", "Toggle looping the current song"),
             ("loop_queue", "Toggle looping the queue"),
+            ("autoplay", "Toggle playing related songs when the queue runs out"),
             ("filter", "Apply a filter to the current song"),
             ("pause", "Pause or resume the currently playing song"),
         ]
@@ -0,0 +1,187 @@
+import asyncio
+import os
+import time
+
+import discord
+
+from bot import metrics
+
+# Discord allows about 5 messages per 5 s in a channel and 50 requests/s per
+# bot. Staying under both keeps player messages from ever earning a 429,
+# which would also stall commands sharing the bucket.
+CHANNEL_RATE = 5
+CHANNEL_PER = 5.0
+GLOBAL_RATE = 40
+GLOBAL_PER = 1.0
+
+# How long a burst (rapid skips, a failing run of tracks) is collected
+# before anything is sent.
+COALESCE_SECONDS = float(os.getenv("NOTIFY_COALESCE_SECONDS", "0.75"))
+MAX_PENDING_NOTICES = 20  # older notices are dropped past this
+NOTICES_PER_MESSAGE = 5
+# The Now Playing message is edited in place until it is this old; then a
+# fresh one is posted so it doesn't sit far up the channel.
+NP_REPOST_MINUTES = int(os.getenv("NP_REPOST_MINUTES", "10"))
+
+NOTIFY_REQUESTS = metrics.counter("notify_requests_total", "Player messages sent or edited, by kind.")
+NOTIFY_DROPPED = metrics.counter("notify_dropped_total", "Player messages coalesced away before sending.")
+NOTIFY_RATE_LIMITED = metrics.counter("notify_rate_limited_total", "429 responses to player messages.")
+
+
+class TokenBucket:
+    """rate requests per `per` seconds, plus a hard pause after a 429."""
+
+    def __init__(self, rate, per):
+        self.rate = rate
+        self.per = per
+        self._tokens = float(rate)
+        self._stamp = time.monotonic()
+        self._blocked_until = 0.0
+
+    def block(self, seconds):
+        """Send nothing for `seconds`, then start again with an empty bucket."""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self._stamp = self._blocked_until
+        self._tokens = 0.0
+
+    def delay(self):
+        """Take a token and return 0, or return how long until one is free."""
+        now = time.monotonic()
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        self._tokens = min(self.rate, self._tokens + (now - self._stamp) * self.rate / self.per)
+        self._stamp = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) * self.per / self.rate
+
+    async def acquire(self):
+        while (wait := self.delay()) > 0:
+            await asyncio.sleep(wait)
+
+
+GLOBAL_BUCKET = TokenBucket(GLOBAL_RATE, GLOBAL_PER)
+
+
+def retry_after(error):
+    """Seconds Discord asked us to wait, or None if error isn't a rate limit.
+
+    discord.py keeps successful responses' X-RateLimit-Remaining to itself,
+    so the local buckets approximate the budget and this reads the headers
+    of the 429s that still get through.
+    """
+    if isinstance(error, discord.RateLimited):
+        return error.retry_after
+    if getattr(error, 'status', None) != 429:
+        return None
+    headers = getattr(error.response, 'headers', None) or {}
+    for name in ('Retry-After', 'X-RateLimit-Reset-After'):
+        try:
+            return float(headers[name])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return 1.0
+
+
+def is_global(error):
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    return str(headers.get('X-RateLimit-Global', '')).lower() == 'true'
+
+
+class ChannelNotifier:
+    """Posts a player's messages to its text channel, off the playback path.
+
+    now_playing() and notice() only record what should be shown and return
+    immediately; a background task sends it. Within a burst only the newest
+    Now Playing survives, and it is edited into one persistent message
+    rather than posted again. Notices are merged several to a message.
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.bucket = TokenBucket(CHANNEL_RATE, CHANNEL_PER)
+        self._embed = None  # newest Now Playing not yet shown
+        self._embed_first = False  # it was set before the pending notices
+        self._notices = []
+        self._message = None  # the persistent Now Playing message
+        self._message_at = 0.0
+        self._task = None
+        self._closed = False
+
+    def now_playing(self, embed):
+        if self._embed is not None:
+            NOTIFY_DROPPED.inc()
+        self._embed = embed
+        self._embed_first = not self._notices
+        self._kick()
+
+    def notice(self, text):
+        if self._notices and self._notices[-1] == text:
+            NOTIFY_DROPPED.inc()
+            return
+        self._notices.append(text)
+        if len(self._notices) > MAX_PENDING_NOTICES:
+            del self._notices[0]
+            NOTIFY_DROPPED.inc()
+        self._kick()
+
+    def close(self):
+        """Drop anything unsent."""
+        self._closed = True
+        self._embed = None
+        self._notices.clear()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def _kick(self):
+        if not self._closed and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._drain())
+
+    async def _drain(self):
+        await asyncio.sleep(COALESCE_SECONDS)
+        while not self._closed and (self._notices or self._embed is not None):
+            await self.bucket.acquire()
+            await GLOBAL_BUCKET.acquire()
+            if self._notices and not (self._embed is not None and self._embed_first):
+                lines = self._notices[:NOTICES_PER_MESSAGE]
+                del self._notices[:NOTICES_PER_MESSAGE]
+                if not await self._deliver(self._post_notice, lines):
+                    self._notices[:0] = lines
+            else:
+                embed, self._embed = self._embed, None
+                if not await self._deliver(self._show, embed) and self._embed is None:
+                    self._embed = embed
+
+    async def _deliver(self, step, item):
+        """Run one request; False means it was rate limited and should be retried."""
+        try:
+            await step(item)
+        except (discord.HTTPException, discord.RateLimited) as e:
+            wait = retry_after(e)
+            if wait is None:
+                print(f"[notify] {e}")
+                return True
+            NOTIFY_RATE_LIMITED.inc()
+            print(f"[notify] rate limited in channel {self.channel.id}, waiting {wait:.1f}s")
+            (GLOBAL_BUCKET if is_global(e) else self.bucket).block(wait)
+            return False
+        return True
+
+    async def _post_notice(self, lines):
+        await self.channel.send("\n".join(lines))
+        NOTIFY_REQUESTS.inc(kind='send')
+
+    async def _show(self, embed):
+        message = self._message
+        if message is not None and time.monotonic() - self._message_at < NP_REPOST_MINUTES * 60:
+            try:
+                await message.edit(embed=embed)
+                NOTIFY_REQUESTS.inc(kind='edit')
+                return
+            except discord.NotFound:
+                self._message = None  # deleted by someone; post a new one
+        self._message = await self.channel.send(embed=embed)
+        self._message_at = time.monotonic()
+        NOTIFY_REQUESTS.inc(kind='send')
@@ -1,59 +1,260 @@
 import discord
 import asyncio
-import yt_dlp
-import spotipy
-import os
-from spotipy.oauth2 import SpotifyClientCredentials
-
-SPOTIPY_CLIENT_ID = os.getenv("SPOTIPY_CLIENT_ID")
-SPOTIPY_CLIENT_SECRET = os.getenv("SPOTIPY_CLIENT_SECRET")
+import time
+from bot import metrics
+from bot.audio_cache import AudioCache, CachedOpusAudio
+from bot.cache import ExtractionCache, normalize_key, youtube_playlist_id
+from bot.extractor import (
+    ExtractionPool, extract_track, open_playlist, next_entries,
+    PRIORITY_PLAY, PRIORITY_PREFETCH, PLAYLIST_BATCH, MAX_PLAYLIST_TRACKS,
+)
+from bot.ffmpeg_supervisor import FFmpegSupervisor
+from bot.loudness import LoudnessAnalyzer, gain_filter
+from bot.notifier import ChannelNotifier
+from bot.radio import Radio, RADIO_BUFFER
+from bot.search_index import SearchIndex
+from bot.spotify import spotify, is_spotify
+from bot.timings import timings
+from bot.track_queue import Track, TrackQueue
 
 FFMPEG_BASE_BEFORE = '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 -nostdin'
 FFMPEG_BASE_OPTIONS = '-vn'
 
-sp = spotipy.Spotify(auth_manager=SpotifyClientCredentials(
-    client_id=SPOTIPY_CLIENT_ID,
-    client_secret=SPOTIPY_CLIENT_SECRET
-))
+# Seconds before the current track ends at which the next track's FFmpeg
+# process is spawned, so its stream is already open when after_play fires.
+PREFETCH_WARM_LEAD = 15
+# How long a new FFmpeg process gets to produce its first packet before the
+# track counts as failed.
+FFMPEG_READY_TIMEOUT = 15
+
+# Unity gain lets FFmpeg hand Discord Opus directly. Any other volume needs
+# per-frame scaling in Python (PCMVolumeTransformer) and in-process encoding.
+DEFAULT_VOLUME = 1.0
+
+# A track that stops more than this many seconds before its known duration
+# died mid-stream (e.g. FFmpeg gave up reconnecting) and is resumed in place.
+EARLY_END_SLACK = 5
+MAX_RESUME_ATTEMPTS = 2
+MAX_CONSECUTIVE_FAILURES = 3  # unplayable tracks skipped before giving up
+
+# GuildMusic.state
+IDLE = "idle"
+LOADING = "loading"
+PLAYING = "playing"
+
+FRAME_SECONDS = 0.02  # one 20 ms audio frame per read()
+
+FFMPEG_SPAWNED = metrics.counter("ffmpeg_spawned_total", "FFmpeg processes started for playback.")
+
+# name -> (FFmpeg -af chain, playback speed relative to the source)
+FILTER_PRESETS = {
+    "nightcore": (
+        "asetrate=48000*1.25,aresample=48000,atempo=1.1,aformat=channel_layouts=stereo,acompressor=threshold=0.5:ratio=2:attack=200:release=1000",
+        1.25 * 1.1,
+    ),
+    "daycore": (
+        "asetrate=48000*0.8,aresample=48000,atempo=0.9,aformat=channel_layouts=stereo,acompressor=threshold=0.5:ratio=2:attack=200:release=1000",
+        0.8 * 0.9,
+    ),
+    "vaporwave": (
+        "asetrate=44100*0.8,aresample=44100,atempo=0.9,aformat=channel_layouts=stereo,acompressor=threshold=0.5:ratio=2:attack=200:release=1000",
+        44100 * 0.8 / 48000 * 0.9,
+    ),
+}
+_FILTER_SPEEDS = {chain: speed for chain, speed in FILTER_PRESETS.values()}
+
+
+def filter_speed(filters):
+    return _FILTER_SPEEDS.get(filters, 1.0)
+
 
+class YTDLSource(discord.AudioSource):
+    """A resolved track plus the FFmpeg source playing it.
 
-class YTDLSource(discord.PCMVolumeTransformer):
-    ytdl = yt_dlp.YoutubeDL({
-        'format': 'bestaudio/best',
-        'quiet': True,
-        'default_search': 'ytsearch',
-        'noplaylist': True
-    })
+    The inner source is picked per track (see from_data); callers only ever
+    see this wrapper, so the player doesn't care which path is in use.
+    """
+    cache = ExtractionCache()
+    audio_cache = AudioCache()
+    pool = ExtractionPool()
+    search_index = SearchIndex()
+    loudness = LoudnessAnalyzer()
+    supervisor = FFmpegSupervisor()
+    _inflight = {}  # normalized key -> (task, job), so identical lookups share one extraction
+    ffmpeg_running = 0
 
-    def __init__(self, source, *, data, volume=0.5):
-        super().__init__(source, volume)
+    def __init__(self, source, *, data, start_time=None, speed=1.0, guild_id=None):
+        self.source = source
         self.data = data
+        self.uses_ffmpeg = not isinstance(source, CachedOpusAudio)
+        self._cleaned = False
+        if self.uses_ffmpeg:
+            YTDLSource.ffmpeg_running += 1
+            FFMPEG_SPAWNED.inc()
+            YTDLSource.supervisor.adopt(self, guild_id)
+        self.start_time = start_time or 0.0
+        self.speed = speed
+        self.frames = 0
+        self._primed = None  # first packet, read ahead by ready()
+        self.ended = False
+        self.on_first_packet = None  # called from the audio thread
         self.title = data.get('title')
         self.url = data.get('url')
         self.thumbnail = data.get('thumbnail')  # added for embed
 
-    @classmethod
-    async def from_url(cls, url, *, loop=None, filters=None, start_time=None):
-        loop = loop or asyncio.get_event_loop()
+    @property
+    def volume(self):
+        return getattr(self.source, 'volume', DEFAULT_VOLUME)
+
+    @property
+    def position(self):
+        """Seconds into the track, in source time (filters change the tempo)."""
+        return self.start_time + self.frames * FRAME_SECONDS * self.speed
+
+    async def ready(self, timeout=FFMPEG_READY_TIMEOUT):
+        """Wait off the event loop for FFmpeg's first packet.
+
+        Connecting and probing happen here rather than in the voice client's
+        audio thread, so a slow or dead stream never reaches it. Raises (and
+        cleans up) if no audio arrives in time.
+        """
+        if not self.uses_ffmpeg or self._primed is not None or self.frames:
+            return
+        loop = asyncio.get_running_loop()
         try:
-            data = await loop.run_in_executor(None, lambda: cls.ytdl.extract_info(url, download=False))
-        except Exception as e:
-            raise RuntimeError(f"yt-dlp extract_info failed: {e}")
+            packet = await asyncio.wait_for(loop.run_in_executor(None, self.source.read), timeout)
+        except asyncio.TimeoutError:
+            packet = None
+        except Exception:
+            self.cleanup()
+            raise
+        if not packet:
+            self.cleanup()  # also unblocks a read still waiting on the pipe
+            raise RuntimeError("FFmpeg produced no audio.")
+        self._primed = packet
 
-        if not data:
-            raise RuntimeError("yt-dlp returned no data.")
+    def read(self):
+        if self._primed is not None:
+            data, self._primed = self._primed, None
+        else:
+            data = self.source.read()
+        if data:
+            if not self.frames and self.on_first_packet:
+                self.on_first_packet()
+            self.frames += 1
+        else:
+            self.ended = True
+        return data
 
-        if 'entries' in data:
-            data = data['entries'][0]
+    def is_opus(self):
+        return self.source.is_opus()
+
+    def cleanup(self):
+        # Called by us and again by discord.py's audio thread; only the first counts.
+        if self._cleaned:
+            return
+        self._cleaned = True
+        if self.uses_ffmpeg:
+            YTDLSource.ffmpeg_running -= 1
+            # Terminated and reaped off the event loop; see FFmpegSupervisor.
+            YTDLSource.supervisor.release(self)
+        else:
+            self.source.cleanup()
+
+    @classmethod
+    async def extract(cls, url, *, guild_id=None, priority=PRIORITY_PLAY):
+        """Resolve a query or URL to the (trimmed) info dict of a single track."""
+        data = cls.cache.get(url)
+        if data:
+            return data
+
+        # A track in the audio cache doesn't need a live stream URL at all.
+        known = cls.cache.metadata(url)
+        if known and known.get('id') in cls.audio_cache:
+            return known
+
+        key = normalize_key(url)
+        entry = cls._inflight.get(key)
+        if entry is None:
+            # An expired stream URL only needs the video page re-resolved, not
+            # another search.
+            target = known.get('webpage_url', url) if known else url
+
+            job = cls.pool.submit(extract_track, target, guild_id=guild_id, priority=priority)
+            task = asyncio.ensure_future(cls._store(url, job.future))
+            entry = cls._inflight[key] = (task, job)
+            task.add_done_callback(lambda t: cls._resolved(key, t))
+        else:
+            cls.pool.promote(entry[1], priority)
+
+        # Shielded so one caller giving up (a cancelled prefetch, a skipped
+        # /play) doesn't cancel the extraction for everyone else waiting on it.
+        return dict(await asyncio.shield(entry[0]))
+
+    @classmethod
+    async def _store(cls, url, future):
+        return cls.cache.put(url, await future)
+
+    @classmethod
+    def _resolved(cls, key, task):
+        if cls._inflight.get(key, (None,))[0] is task:
+            del cls._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved even if every waiter went away
+
+    @classmethod
+    async def stream_playlist(cls, url, *, guild_id=None, limit=MAX_PLAYLIST_TRACKS,
+                              priority=PRIORITY_PLAY):
+        """Yield batches of flat entries (id, title, duration) from a playlist.
+
+        Only the first page is fetched at the given priority; the rest is
+        listed as background work so a big import doesn't hold up other guilds.
+        """
+        _, entries = await cls.pool.run(
+            open_playlist, url, guild_id=guild_id, priority=priority, local=True
+        )
+        remaining = limit
+        while remaining > 0:
+            batch, exhausted = await cls.pool.run(
+                next_entries, entries, min(PLAYLIST_BATCH, remaining),
+                guild_id=guild_id, priority=priority, local=True,
+            )
+            if batch:
+                yield batch
+            if exhausted:
+                return
+            remaining -= PLAYLIST_BATCH
+            priority = PRIORITY_PREFETCH
+
+    @classmethod
+    def from_data(cls, data, *, filters=None, start_time=None, volume=DEFAULT_VOLUME,
+                  guild_id=None):
+        """Spawn FFmpeg on an already resolved info dict.
 
-        stream_url = data.get('url')
-        if not stream_url:
-            raise RuntimeError("No playable URL found in yt-dlp data.")
+        - unity volume, no filter, Opus stream: remux the Opus packets as-is
+        - unity volume otherwise: FFmpeg applies the filter and encodes Opus
+        - any other volume: decode to PCM and scale frames in Python
 
-        before = FFMPEG_BASE_BEFORE
+        Tracks in the audio cache are read from disk: directly when no
+        processing is needed, otherwise through FFmpeg without -reconnect.
+
+        A measured loudness gain joins the -af chain, so it costs nothing
+        per frame in Python; cached files already have it applied.
+        """
+        local = cls.audio_cache.lookup(data.get('id'))
+        if local and not filters and volume == DEFAULT_VOLUME:
+            return cls(CachedOpusAudio(local, start_time=start_time), data=data, start_time=start_time)
+
+        speed = filter_speed(filters)
+        gain = None if local else gain_filter(cls.loudness.gain(data.get('id')))
+        if gain:
+            filters = f"{gain},{filters}" if filters else gain
+
+        source_url = local or data['url']
+        before = '-nostdin' if local else FFMPEG_BASE_BEFORE
         options = FFMPEG_BASE_OPTIONS
         if start_time:
-            before = f"{before} -ss {start_time}"
+            before = f"{before} -ss {start_time:.2f}"
         if filters:
             options = f'{options} -af "{filters}"'
 
@@ -62,137 +263,676 @@ class YTDLSource(discord.PCMVolumeTransformer):
             'options': options
         }
 
-        source = discord.FFmpegPCMAudio(stream_url, **ffmpeg_kwargs)
-        return cls(source, data=data)
+        if volume != DEFAULT_VOLUME:
+            source = discord.PCMVolumeTransformer(
+                discord.FFmpegPCMAudio(source_url, **ffmpeg_kwargs), volume
+            )
+        else:
+            passthrough = (
+                not filters
+                and data.get('acodec') == 'opus'
+                and data.get('asr', 48000) == 48000
+            )
+            source = discord.FFmpegOpusAudio(
+                source_url, codec='copy' if passthrough else None, **ffmpeg_kwargs
+            )
+        return cls(source, data=data, start_time=start_time, speed=speed, guild_id=guild_id)
 
 
 class GuildMusic:
     def __init__(self, bot, guild):
         self.bot = bot
         self.guild = guild
-        self.queue = []
-        self.history = []
+        self.queue = TrackQueue()
         self.current = None
         self.loop_song = False
         self.loop_queue = False
         self.autoplay = False
+        self.radio = Radio(
+            guild.id, YTDLSource.extract, YTDLSource.stream_playlist,
+            on_candidate=self._prefetch_if_idle,
+        )
         self.global_filter = None
-        self.force_filter = None
-        self.replaying = False
-        self.manual_skip = False
-        self._empty_sent = False
+        self.text_channel = None  # where Now Playing and errors are posted
+        self._notifier = None  # ChannelNotifier for text_channel
+        self.state = IDLE
+        self._mailbox = []
+        self._wake = asyncio.Event()
+        self._runner = None
+        self._resume_attempts = 0
+        self._failures = 0
+        self._source = None  # the YTDLSource actually feeding the voice client
+        self._prefetch = None  # (track, task) resolving the track that plays next
+        self._warm = None  # (track, filters, source) with FFmpeg already spawned
+        self._warm_handle = None
+        self._loading = None  # source waiting in ready() for its first packet
+        self._track_started = None
+        self._track_duration = None
+        self._gap_from = None  # when the previous song ended on its own
+        self.last_active = time.monotonic()  # read by MusicCog's idle sweep
+
+    def _next_entry(self):
+        """The Track that plays when the current song ends."""
+        if self.loop_song and self.current:
+            return self.current
+        if self.queue:
+            return self.queue[0]
+        if self.loop_queue and self.current:
+            return self.current
+        if self.autoplay:
+            return self.radio.peek()
+        return None
+
+    def invalidate_prefetch(self):
+        """Drop prefetched work; call whenever what plays next changes."""
+        if self._prefetch:
+            _, task = self._prefetch
+            task.cancel()
+            self._prefetch = None
+        if self._warm_handle:
+            self._warm_handle.cancel()
+            self._warm_handle = None
+        if self._warm:
+            _, _, source = self._warm
+            source.cleanup()
+            self._warm = None
+
+    def schedule_prefetch(self):
+        """Start resolving the next track in the background."""
+        track = self._next_entry()
+        if track is None:
+            self.invalidate_prefetch()
+            return
+        if self._prefetch and self._prefetch[0] is track:
+            return
+        self.invalidate_prefetch()
+
+        active_filter = self.active_filter(track)
+        task = self.bot.loop.create_task(YTDLSource.extract(
+            track.lookup, guild_id=self.guild.id, priority=PRIORITY_PREFETCH
+        ))
+        task.add_done_callback(lambda t: self._on_prefetched(t, track, active_filter))
+        self._prefetch = (track, task)
+
+    def _on_prefetched(self, task, track, active_filter):
+        if task.cancelled():
+            return
+        if task.exception():
+            print(f"[prefetch] {track.query}: {task.exception()}")
+            return
+        if not self._prefetch or self._prefetch[1] is not task:
+            return
+
+        # Hold off spawning FFmpeg until the current song is nearly over, so we
+        # don't keep an idle stream open for the whole track.
+        delay = 0
+        if self._track_started is not None and self._track_duration:
+            elapsed = self.bot.loop.time() - self._track_started
+            delay = max(0, self._track_duration - elapsed - PREFETCH_WARM_LEAD)
+        track.update(task.result())
+        YTDLSource.loudness.analyze(task.result())
+        self._warm_handle = self.bot.loop.call_later(
+            delay, self._warm_up, task.result(), track, active_filter
+        )
+
+    def _warm_up(self, data, track, active_filter):
+        self._warm_handle = None
+        if not YTDLSource.supervisor.has_room():
+            return  # the track gets its process when it starts instead
+        try:
+            source = YTDLSource.from_data(data, filters=active_filter, guild_id=self.guild.id)
+        except Exception as e:
+            print(f"[prefetch] FFmpeg warm-up failed for {track.query}: {e}")
+            return
+        self._warm = (track, active_filter, source)
+
+    async def _take_prefetched(self, track, active_filter):
+        """Return a ready player for track if the prefetcher has one, else None."""
+        prefetch, warm = self._prefetch, self._warm
+        if self._warm_handle:
+            self._warm_handle.cancel()
+            self._warm_handle = None
+        self._prefetch = None
+        self._warm = None
+
+        if warm:
+            warm_track, warm_filter, source = warm
+            if warm_track is track and warm_filter == active_filter:
+                return source
+            source.cleanup()
+
+        if not prefetch:
+            return None
+        prefetch_track, task = prefetch
+        if prefetch_track is not track:
+            task.cancel()
+            return None
 
-    async def add_song(self, query, *, filters=None):
-        if "spotify.com" in query:
+        # Extraction may still be in flight; joining it is never slower than
+        # starting over.
+        if task.cancelled():
+            return None
+        try:
+            data = await asyncio.shield(task)
+        except Exception:
+            return None
+        return await self._spawn(data, filters=active_filter)
+
+    async def _spawn(self, data, **kwargs):
+        """from_data once the host has an FFmpeg slot free.
+
+        Only a cached file played as-is skips FFmpeg (and the wait); filters
+        or a volume change still run it, cached or not.
+        """
+        direct = (data.get('id') in YTDLSource.audio_cache and not kwargs.get('filters')
+                  and kwargs.get('volume', DEFAULT_VOLUME) == DEFAULT_VOLUME)
+        if not direct:
+            await YTDLSource.supervisor.slot()
+        return YTDLSource.from_data(data, guild_id=self.guild.id, **kwargs)
+
+    async def add_song(self, query, *, filters=None, on_queued=None):
+        """Queue query; on_queued() runs once the first track is in the queue."""
+        if is_spotify(query):
+            count = 0
+            started = time.perf_counter()
             try:
-                if "track" in query:
-                    track = sp.track(query)
-                    if track and track.get('artists') and track.get('name'):
-                        query = f"{track['artists'][0]['name']} {track['name']}"
-                    else:
-                        print("Skipped invalid Spotify track")
-                        return
-                elif "playlist" in query:
-                    offset = 0
-                    count = 0
-                    while True:
-                        playlist = sp.playlist_items(query, offset=offset, limit=100)
-                        if not playlist['items']:
-                            break
-                        for item in playlist['items']:
-                            track = item.get('track')
-                            if not track:
-                                continue
-                            try:
-                                if not track.get('artists') or not track.get('name'):
-                                    continue
-                                track_query = f"{track['artists'][0]['name']} {track['name']}"
-                                self.queue.append((track_query, filters))
-                                count += 1
-                            except Exception as e:
-                                print(f"Skipped a track due to error: {e}")
-                        offset += 100
-                        if len(playlist['items']) < 100:
-                            break
-                    print(f"Queued {count} songs from Spotify playlist")
-                    return
+                # Batches land page by page, so playback can start on the
+                # first page while the rest of a big playlist is still loading.
+                async for batch in spotify.iter_tracks(query):
+                    self.queue.extend(
+                        Track(track_query, filters, duration=duration)
+                        for track_query, duration in batch
+                    )
+                    if batch and count == 0:
+                        timings.since('spotify', started, self.guild.id)
+                        if on_queued:
+                            on_queued()
+                    count += len(batch)
+                    self.touch()
+                    self._prefetch_if_idle()
             except Exception as e:
                 print(f"Spotify error: {e}")
-                return
+            if count > 1:
+                print(f"Queued {count} songs from Spotify")
+            elif count == 0:
+                print("Skipped invalid Spotify link")
+            return
+
+        if youtube_playlist_id(query):
+            count = 0
+            try:
+                async for batch in YTDLSource.stream_playlist(query, guild_id=self.guild.id):
+                    # Only stubs are queued; each entry is fully resolved when
+                    # the prefetcher or player gets to it.
+                    self.queue.extend(
+                        Track(
+                            f"https://www.youtube.com/watch?v={entry['id']}", filters,
+                            title=entry['title'], video_id=entry['id'],
+                            duration=entry['duration'],
+                        )
+                        for entry in batch
+                    )
+                    if count == 0 and on_queued:
+                        on_queued()
+                    count += len(batch)
+                    self.touch()
+                    self._prefetch_if_idle()
+            except Exception as e:
+                print(f"YouTube playlist error: {e}")
+            print(f"Queued {count} songs from YouTube playlist")
+            return
 
         if query:
-            self.queue.append((query, filters))
-
-    async def play_next(self, text_channel=None, interaction=None, force_filters=None):
-        filters = None
-
-        if force_filters and self.current:
-            query, _ = self.current
-            filters = force_filters
-            self.current = (query, filters)
-        elif self.force_filter and self.current:
-            query, _ = self.current
-            filters = None if self.force_filter == "RESET_FILTER" else self.force_filter
-            self.current = (query, filters)
-            self.force_filter = None
-        elif self.loop_song and self.current:
-            query, filters = self.current
+            # A query or title we've played before goes straight to its
+            # video instead of another ytsearch.
+            known = YTDLSource.search_index.lookup(query) or {}
+            self.queue.append(Track(query, filters, **known))
+            self._prefetch_if_idle()
+            if on_queued:
+                on_queued()
+
+    def _prefetch_if_idle(self):
+        # Songs queued while something plays: the prefetcher may have had
+        # nothing to look at when the current track started.
+        if self.current and self._prefetch is None:
+            self.schedule_prefetch()
+
+    @property
+    def position(self):
+        """Seconds into the current track, in source time."""
+        return self._source.position if self._source else 0.0
+
+    def active_filter(self, track):
+        return track.filters if track.filters is not None else self.global_filter
+
+    # ---------------- Lifecycle ----------------
+
+    @property
+    def is_idle(self):
+        """Nothing loading or audible; a paused player counts as idle."""
+        vc = self.guild.voice_client
+        return self.state != LOADING and not (vc and vc.is_playing())
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    def source_state(self, source):
+        """How this player holds a YTDLSource: 'playing', 'held' or None (not at all)."""
+        vc = self.guild.voice_client
+        if source is self._source or (vc and vc.source is source):
+            return 'playing' if vc and vc.is_playing() else 'held'
+        if source is self._loading or (self._warm and self._warm[2] is source):
+            return 'held'
+        return None
+
+    def park(self):
+        """Stop playback but keep the current song at the front of the queue."""
+        if self.current:
+            self.queue.appendleft(self.current)
+            self.current = None
+        self.invalidate_prefetch()
+        self._halt()
+
+    def close(self):
+        """Release the runner, FFmpeg processes and channel references."""
+        self.park()
+        self._mailbox.clear()
+        self.radio.clear()
+        if self._runner:
+            self._runner.cancel()
+            self._runner = None
+        self.text_channel = None
+        if self._notifier:
+            self._notifier.close()
+            self._notifier = None
+        self._track_started = None
+        self._track_duration = None
+
+    def restore(self, state):
+        """Load saved state; the saved current song goes back to the front."""
+        if state.get('current'):
+            self.queue.append(Track.from_row(state['current']))
+        self.queue.extend(Track.from_row(row) for row in state.get('queue', []))
+        self.loop_song = state.get('loop_song', False)
+        self.loop_queue = state.get('loop_queue', False)
+        self.global_filter = state.get('global_filter')
+
+    # ---------------- Commands ----------------
+    #
+    # Everything that changes what is playing is posted to a per-guild
+    # mailbox and applied by a single runner task. A burst of commands (five
+    # /skips in a row, a /filter during a skip) is folded into one
+    # transition, so a state change starts at most one extraction.
+
+    def request_play(self, text_channel=None):
+        """Start playing the queue if nothing is playing."""
+        if text_channel:
+            self.text_channel = text_channel
+        self.post('play')
+
+    def resume(self, position, text_channel=None):
+        """Play the front of the queue from position, e.g. after a restart."""
+        if text_channel:
+            self.text_channel = text_channel
+        self.post('resume', position=position)
+
+    def skip(self, count=1):
+        self.post('skip', count=count)
+
+    def skip_to(self, index):
+        """Make queue position index (1-based) the next song and play it now."""
+        target_pos = index - 1
+        if self.loop_queue:
+            self.queue.rotate(target_pos)
         else:
-            if not self.queue:
-                if self.loop_queue and self.current:
-                    query, filters = self.current
+            self.queue.drop(target_pos)
+        self.invalidate_prefetch()
+        self.post('skipto')
+
+    def set_filter(self, filters):
+        self.global_filter = filters
+        if self.current:
+            self.current = self.current.with_filters(filters)
+        self.invalidate_prefetch()
+        self.post('filter')
+
+    def set_autoplay(self, enabled):
+        self.autoplay = enabled
+        if enabled:
+            self.radio.top_up()
+        else:
+            self.radio.clear()
+        if self.current:
+            self.schedule_prefetch()
+
+    def stop(self):
+        self.queue.clear()
+        self.loop_song = False
+        self.loop_queue = False
+        self.autoplay = False
+        self.radio.clear()
+        self.global_filter = None
+        self.invalidate_prefetch()
+        self._halt()
+        self.post('stop')
+
+    def post(self, command, **kwargs):
+        self.touch()
+        self._mailbox.append((command, kwargs))
+        if self._runner is None or self._runner.done():
+            self._runner = self.bot.loop.create_task(self._run())
+        self._wake.set()
+
+    def _after_play(self, error):
+        # Runs on the audio thread.
+        if error:
+            print(f"[after_play error] {error}")
+        ended_at = time.perf_counter()
+        self.bot.loop.call_soon_threadsafe(
+            lambda: self.post('finished', error=error, ended_at=ended_at)
+        )
+
+    def _has_pending_transition(self):
+        return any(command in ('skip', 'skipto', 'stop') for command, _ in self._mailbox)
+
+    # ---------------- Runner ----------------
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            while self._mailbox:
+                commands, self._mailbox = self._mailbox, []
+                try:
+                    await self._apply(commands)
+                except Exception as e:
+                    print(f"[player] guild {self.guild.id}: {e}")
+                    self.state = IDLE if self._source is None else PLAYING
+
+    async def _apply(self, commands):
+        stop = False
+        advance = 0
+        resume = None
+        refilter = False
+        start_at = None
+
+        for command, kwargs in commands:
+            if command == 'stop':
+                stop = True
+                advance = 0
+                resume = None
+                refilter = False
+                start_at = None
+            elif command == 'play':
+                if self.state != IDLE and not self._voice_busy():
+                    # The voice connection went away under us (kicked,
+                    # dropped); start over with the current song.
+                    self.park()
+                if self.state == IDLE and not advance and start_at is None:
+                    advance = 1
+            elif command == 'resume':
+                if self.state == IDLE and not advance:
+                    start_at = kwargs['position']
+            elif command == 'skip':
+                if self.current:
+                    advance += kwargs['count']
+                    resume = None
+            elif command == 'skipto':
+                # The queue was already rearranged; earlier skips are moot.
+                advance = 1
+                resume = None
+            elif command == 'filter':
+                refilter = True
+            elif command == 'finished':
+                source = self._source
+                # Sources we replaced or stopped on purpose are detached
+                # first, so their after callbacks land here and are ignored.
+                if source is None:
+                    continue
+                if not (source.ended or kwargs['error']):
+                    if not self._voice_busy():
+                        # Stopped from outside, e.g. a disconnect: nothing is
+                        # playing any more, so don't claim otherwise.
+                        self.park()
+                    continue
+                if self.current and self._ended_early(source, kwargs['error']):
+                    resume = source
                 else:
-                    self.current = None
-                    if not self._empty_sent:
-                        self._empty_sent = True
-                        if interaction:
-                            await interaction.followup.send("Queue is empty.")
-                        elif text_channel:
-                            await text_channel.send("Queue is empty.")
-                    return
-            else:
-                query, filters = self.queue.pop(0)
+                    advance += 1
+                    self._gap_from = kwargs['ended_at']
+
+        if stop:
+            self._halt()
+            self.current = None
+        if advance:
+            await self._advance(advance)
+        elif resume is not None:
+            await self._replay_current(resume.position, resume=True)
+        elif start_at is not None and self.queue:
+            self.current = self.queue.popleft()
+            self._send(f"▶️ Resuming **{self.current.display_title}**.")
+            await self._start(self.current, start_time=start_at or None)
+        elif refilter:
+            if not await self.restart_current() and self.current and self.state == PLAYING:
+                await self._replay_current(self.position)
+            self.schedule_prefetch()
+
+    def _voice_busy(self):
+        vc = self.guild.voice_client
+        return vc is not None and (vc.is_playing() or vc.is_paused())
+
+    def _halt(self):
+        """Detach and stop whatever is playing."""
+        self._source = None
+        self.state = IDLE
+        vc = self.guild.voice_client
+        if vc and (vc.is_playing() or vc.is_paused()):
+            vc.stop()
+
+    async def _advance(self, count):
+        for _ in range(count):
+            if self.loop_song and self.current:
+                break
+            if self.queue:
+                track = self.queue.popleft()
                 if self.current and self.loop_queue:
                     self.queue.append(self.current)
-                self.current = (query, filters)
+                self.current = track
+            elif not (self.loop_queue and self.current):
+                self.current = None
+                break
+
+        if self.current is None and self.autoplay:
+            self.current = await self.radio.next()
+
+        if self.current is None:
+            was_playing = self.state != IDLE or self._source is not None
+            self.invalidate_prefetch()
+            self._halt()
+            if was_playing:
+                self._send("Queue is empty.")
+            return
+
+        await self._start(self.current)
 
-        active_filter = filters if filters is not None else self.global_filter
+    async def _start(self, track, start_time=None):
+        """Resolve track and put it on the voice client: one extraction at most."""
+        self.state = LOADING
+        active_filter = self.active_filter(track)
+        started = time.perf_counter()
+        gap_from, self._gap_from = self._gap_from, None
 
         try:
-            player = await YTDLSource.from_url(query, loop=self.bot.loop, filters=active_filter)
+            player = None
+            if start_time is None:
+                player = await self._take_prefetched(track, active_filter)
+                if player is not None:
+                    try:
+                        mark = time.perf_counter()
+                        await self._ready(player)
+                        timings.since('first_packet', mark, self.guild.id)
+                    except Exception as e:
+                        # e.g. a warmed stream that expired; start it afresh.
+                        print(f"[prefetch] {track.query}: {e}")
+                        player = None
+            if player is None:
+                mark = time.perf_counter()
+                data = await YTDLSource.extract(track.lookup, guild_id=self.guild.id)
+                timings.since('extract', mark, self.guild.id)
+                mark = time.perf_counter()
+                player = await self._spawn(data, filters=active_filter, start_time=start_time)
+                timings.since('ffmpeg_spawn', mark, self.guild.id)
+                mark = time.perf_counter()
+                await self._ready(player)
+                timings.since('first_packet', mark, self.guild.id)
         except Exception as e:
-            msg = f"❌ Error playing `{query}`: {e}"
-            if interaction:
-                await interaction.followup.send(msg)
-            elif text_channel:
-                await text_channel.send(msg)
+            if self._has_pending_transition():
+                return
+            self._send(f"❌ Error playing `{track.display_title}`: {e}")
+            self._failures += 1
+            if self._failures < MAX_CONSECUTIVE_FAILURES:
+                await self._advance(1)
+            else:
+                self._failures = 0
+                self._halt()
+            return
+
+        if self._has_pending_transition():
+            # Superseded while resolving; the next round picks the real target.
+            player.cleanup()
             return
 
         vc = self.guild.voice_client
         if not vc:
-            msg = "Bot is not connected to a voice channel."
-            if interaction:
-                await interaction.followup.send(msg)
-            elif text_channel:
-                await text_channel.send(msg)
+            player.cleanup()
+            self._halt()
+            self._send("Bot is not connected to a voice channel.")
             return
 
-        def after_play(error):
-            if error:
-                print(f"[after_play error] {error}")
-            if not self.replaying and not self.manual_skip:
-                asyncio.run_coroutine_threadsafe(
-                    self.play_next(text_channel=text_channel, interaction=interaction),
-                    self.bot.loop
-                )
-
-        if vc.is_playing():
+        track.update(player.data)
+        self._source = None  # detach first so the old after callback is ignored
+        if vc.is_playing() or vc.is_paused():
             vc.stop()
-            await asyncio.sleep(0.2)
+        played = time.perf_counter()
+        player.on_first_packet = lambda: self.bot.loop.call_soon_threadsafe(
+            self._first_packet, started, played, gap_from
+        )
+        try:
+            vc.play(player, after=self._after_play)
+        except discord.ClientException as e:
+            # e.g. the connection dropped since we looked; keep the song queued.
+            player.cleanup()
+            self.park()
+            self._send(f"❌ Couldn't start `{track.display_title}`: {e}")
+            return
+        self._source = player
+        self.state = PLAYING
+        self._failures = 0
+        self._track_started = self.bot.loop.time() - (start_time or 0)
+        self._track_duration = player.data.get('duration')
+        self.radio.played(track)
+        if self.autoplay and len(self.queue) < RADIO_BUFFER:
+            self.radio.top_up()
+        self.schedule_prefetch()
+
+        if start_time is None:
+            self._resume_attempts = 0
+            YTDLSource.loudness.analyze(player.data)
+            YTDLSource.audio_cache.record_play(
+                player.data, gain=YTDLSource.loudness.gain(player.data.get('id'))
+            )
+            YTDLSource.search_index.record(player.data, track.query)
+            self._announce(player, active_filter)
+
+    async def _ready(self, source):
+        """source.ready(), holding the source so the supervisor's sweep
+        doesn't take it for an orphan while FFmpeg connects."""
+        self._loading = source
+        try:
+            await source.ready()
+        finally:
+            if self._loading is source:
+                self._loading = None
+
+    def _first_packet(self, started, played, gap_from):
+        now = time.perf_counter()
+        timings.record('handoff', now - played, self.guild.id)
+        timings.record('start', now - started, self.guild.id)
+        if gap_from is not None:
+            timings.record('gap', now - gap_from, self.guild.id)
+
+    async def restart_current(self):
+        """Respawn FFmpeg for the current track at the current position.
+
+        Used for filter changes: the resolved stream is reused and the new
+        source is swapped in under the voice client, so there's no
+        re-extraction, no after_play and no restart from 0:00.
+        """
+        vc = self.guild.voice_client
+        old = self._source
+        if not self.current or old is None or not vc or not (vc.is_playing() or vc.is_paused()):
+            return False
+
+        data = await YTDLSource.extract(self.current.lookup, guild_id=self.guild.id)
+        # No slot wait: the old process is released as soon as this one is in.
+        new = YTDLSource.from_data(
+            data, filters=self.active_filter(self.current), start_time=old.position,
+            guild_id=self.guild.id,
+        )
+        try:
+            await self._ready(new)
+        except Exception as e:
+            print(f"[filter] {self.current.query}: {e}")
+            return False  # the caller replays the track instead
+        if self._source is not old or not (vc.is_playing() or vc.is_paused()):
+            # The track changed or ended while we were resolving.
+            new.cleanup()
+            return False
+        paused = vc.is_paused()
+        vc.source = new  # discord.py resumes the player as part of the swap
+        if paused:
+            vc.pause()
+        self._source = new
+        old.cleanup()
+        return True
+
+    def _ended_early(self, source, error):
+        if self._resume_attempts >= MAX_RESUME_ATTEMPTS:
+            return False
+        if error:
+            return True
+        duration = source.data.get('duration')
+        return bool(duration) and source.position < duration - EARLY_END_SLACK
+
+    async def _replay_current(self, position, resume=False):
+        """Play the current track again from position, e.g. after FFmpeg gave up."""
+        track = self.current
+        if resume:
+            self._resume_attempts += 1
+            print(f"[resume] {track.display_title} stopped at {position:.1f}s, reconnecting")
+            # The old stream URL is the likely culprit, so resolve a fresh one.
+            YTDLSource.cache.expire_stream(track.lookup)
+        await self._start(track, start_time=position)
+
+    # ---------------- Messages ----------------
+
+    #
+    # Sending never blocks playback: messages are handed to the channel's
+    # notifier, which coalesces and rate-limits them in the background.
+
+    def _notifications(self):
+        if self.text_channel is None:
+            return None
+        if self._notifier is None or self._notifier.channel is not self.text_channel:
+            self._notifier = ChannelNotifier(self.text_channel)
+        return self._notifier
 
-        self.replaying = False
-        vc.play(player, after=after_play)
+    def _send(self, content):
+        notifier = self._notifications()
+        if notifier:
+            notifier.notice(content)
 
+    def _announce(self, player, active_filter):
         # Now Playing Embed
         embed = discord.Embed(
             title="🎶 Now Playing",
@@ -202,18 +942,6 @@ class GuildMusic:
         embed.add_field(name="Filter", value=active_filter or "None", inline=True)
         if getattr(player, "thumbnail", None):
             embed.set_thumbnail(url=player.thumbnail)
-        if text_channel:
-            await text_channel.send(embed=embed)
-
-    async def stop(self, interaction=None):
-        vc = self.guild.voice_client
-        if vc and vc.is_playing():
-            vc.stop()
-        self.queue.clear()
-        self.current = None
-        self.loop_song = False
-        self.loop_queue = False
-        self.global_filter = None
-        self.force_filter = None
-        self.replaying = False
-        self._empty_sent = False
+        notifier = self._notifications()
+        if notifier:
+            notifier.now_playing(embed)
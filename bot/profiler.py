@@ -0,0 +1,93 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))  # seconds between samples
+PROFILE_DIR = os.getenv("PROFILE_DIR", "cache/profiles")
+MAX_DEPTH = 40
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Samples one thread's stack from a background thread.
+
+    Meant for the event loop thread: it sees what is hogging the loop with
+    no tracing overhead, and can be switched on and off while the bot runs.
+    Stacks are kept in collapsed form, ready for flamegraph.pl/speedscope.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self._stacks = Counter()
+        self._samples = 0
+        self._thread = None
+        self._stop = threading.Event()
+        self._target = None
+        self.started_at = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, thread_id=None):
+        """Start sampling thread_id (default: the calling thread)."""
+        if self.running:
+            return False
+        self._target = thread_id or threading.get_ident()
+        self._stacks.clear()
+        self._samples = 0
+        self._stop.clear()
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        if not self.running:
+            return False
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            self._stacks[";".join(reversed(stack))] += 1
+            self._samples += 1
+
+    def top(self, count=10):
+        """[(share of samples, function)] by self time: where the loop actually was."""
+        leaves = Counter()
+        for stack, hits in list(self._stacks.items()):
+            leaves[stack.rsplit(";", 1)[-1]] += hits
+        total = self._samples or 1
+        return [(hits / total, name) for name, hits in leaves.most_common(count)]
+
+    def dump(self, directory=PROFILE_DIR):
+        """Write the collapsed stacks to a file and return its path."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"profile-{int(time.time())}.txt")
+        with open(path, 'w') as f:
+            for stack, hits in list(self._stacks.items()):
+                f.write(f"{stack} {hits}\n")
+        return path
+
+    @property
+    def samples(self):
+        return self._samples
+
+
+profiler = SamplingProfiler()
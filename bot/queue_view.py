@@ -0,0 +1,123 @@
+import discord
+
+MAX_QUEUE_PAGE = 10  # number of songs per embed page
+QUEUE_VIEW_TIMEOUT = 120
+
+
+def page_count(queue):
+    return max(1, -(-len(queue) // MAX_QUEUE_PAGE))
+
+
+def render_page(queue, page, highlight=None):
+    """(page, embed) for one page of the live queue; page is clamped.
+
+    Only the tracks on that page are touched, so the cost doesn't depend on
+    how long the queue is.
+    """
+    total = len(queue)
+    page = max(0, min(page, page_count(queue) - 1))
+    start = page * MAX_QUEUE_PAGE
+    lines = []
+    for index, track in enumerate(queue.window(start, MAX_QUEUE_PAGE), start=start + 1):
+        marker = "▶ " if index - 1 == highlight else ""
+        if track.filters:
+            lines.append(f"{marker}{index}. **{track.display_title}** — `{track.filters}`")
+        else:
+            lines.append(f"{marker}{index}. **{track.display_title}**")
+
+    embed = discord.Embed(
+        title=f"Queue (songs {start + 1}-{start + len(lines)})" if lines else "Queue",
+        description="\n".join(lines) or "The queue is currently empty.",
+        color=discord.Color.blurple(),
+    )
+    embed.set_footer(text=f"Page {page + 1}/{page_count(queue)} · {total} songs")
+    return page, embed
+
+
+class QueueView(discord.ui.View):
+    """Pages through a guild's queue, rendering each page when it is shown.
+
+    Holds the queue itself rather than prebuilt embeds, so a view costs the
+    same for 10 songs or 10,000 and always shows the queue as it is now.
+    """
+
+    def __init__(self, queue):
+        super().__init__(timeout=QUEUE_VIEW_TIMEOUT)
+        self.queue = queue
+        self.page = 0
+        self.highlight = None  # queue index of the last search hit
+        self.version = queue.version  # queue version the highlight refers to
+
+    def first_page(self):
+        self.page, embed = render_page(self.queue, 0)
+        self._update_buttons()
+        return embed
+
+    def _update_buttons(self):
+        last = page_count(self.queue) - 1
+        self.prev.disabled = self.page <= 0
+        self.next.disabled = self.page >= last
+
+    async def show(self, interaction, page):
+        if self.queue.version != self.version:
+            # Songs moved since the hit was found, so its index means nothing now.
+            self.highlight = None
+            self.version = self.queue.version
+        self.page, embed = render_page(self.queue, page, self.highlight)
+        self._update_buttons()
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.primary)
+    async def prev(self, interaction_button, button):
+        await self.show(interaction_button, self.page - 1)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.primary)
+    async def next(self, interaction_button, button):
+        await self.show(interaction_button, self.page + 1)
+
+    @discord.ui.button(label="Go to page", style=discord.ButtonStyle.secondary)
+    async def jump(self, interaction_button, button):
+        await interaction_button.response.send_modal(JumpModal(self))
+
+    @discord.ui.button(label="Search", style=discord.ButtonStyle.secondary)
+    async def search(self, interaction_button, button):
+        await interaction_button.response.send_modal(SearchModal(self))
+
+
+class JumpModal(discord.ui.Modal, title="Go to page"):
+    number = discord.ui.TextInput(label="Page number", max_length=7)
+
+    def __init__(self, queue_view):
+        super().__init__()
+        self.queue_view = queue_view
+
+    async def on_submit(self, interaction):
+        try:
+            page = int(self.number.value) - 1
+        except ValueError:
+            await interaction.response.send_message("That isn't a page number.", ephemeral=True)
+            return
+        await self.queue_view.show(interaction, page)
+
+
+class SearchModal(discord.ui.Modal, title="Search the queue"):
+    text = discord.ui.TextInput(label="Title contains", max_length=100)
+
+    def __init__(self, queue_view):
+        super().__init__()
+        self.queue_view = queue_view
+
+    async def on_submit(self, interaction):
+        view = self.queue_view
+        needle = self.text.value.casefold()
+        # Searching again continues after the previous hit.
+        start = view.highlight + 1 if view.highlight is not None else 0
+        index = view.queue.find(lambda track: needle in track.display_title.casefold(), start)
+        if index is None:
+            await interaction.response.send_message(
+                f"No song in the queue matches `{self.text.value}`.", ephemeral=True
+            )
+            return
+        view.highlight = index
+        view.version = view.queue.version
+        await view.show(interaction, index // MAX_QUEUE_PAGE)
@@ -0,0 +1,137 @@
+import asyncio
+import os
+from collections import deque
+
+from bot.extractor import PRIORITY_PREFETCH
+from bot.track_queue import Track
+
+RADIO_BUFFER = int(os.getenv("RADIO_BUFFER", "3"))  # resolved candidates kept ready
+RADIO_RECENT = 500  # video ids remembered so autoplay doesn't repeat itself
+RADIO_SEEDS = 5  # recently played songs candidates are drawn from
+RADIO_MIX_SIZE = 25  # mix entries read per fill
+RADIO_WAIT = 20  # seconds an empty queue waits on an in-flight fill
+
+
+def mix_url(video_id):
+    """YouTube's auto-generated mix (radio) for a video."""
+    return f"https://www.youtube.com/watch?v={video_id}&list=RD{video_id}"
+
+
+class RecentSet:
+    """The last `size` video ids, with O(1) membership tests."""
+
+    def __init__(self, size=RADIO_RECENT):
+        self.size = size
+        self._order = deque()
+        self._ids = set()
+
+    def add(self, video_id):
+        if video_id in self._ids:
+            return
+        self._order.append(video_id)
+        self._ids.add(video_id)
+        if len(self._order) > self.size:
+            self._ids.discard(self._order.popleft())
+
+    def __contains__(self, video_id):
+        return video_id in self._ids
+
+    def __len__(self):
+        return len(self._order)
+
+
+class Radio:
+    """Autoplay candidates for one guild, resolved before they are needed.
+
+    Candidates come from the YouTube mixes of recently played songs. A
+    background fill keeps a few of them extracted (so they sit in the
+    extraction cache), and the player treats the first one as the next
+    track, so it gets prefetched and warmed like any queued song.
+    """
+
+    def __init__(self, guild_id, extract, list_playlist, on_candidate=None):
+        self.guild_id = guild_id
+        self._extract = extract  # YTDLSource.extract
+        self._list = list_playlist  # YTDLSource.stream_playlist
+        self._on_candidate = on_candidate
+        self.recent = RecentSet()
+        self.buffer = deque()
+        self._seeds = deque(maxlen=RADIO_SEEDS)
+        self._task = None
+
+    def played(self, track):
+        """Note a song that started, so it seeds the radio and isn't repeated."""
+        if track.video_id:
+            self.recent.add(track.video_id)
+            if track.video_id in self._seeds:
+                self._seeds.remove(track.video_id)
+            self._seeds.append(track.video_id)
+
+    def peek(self):
+        return self.buffer[0] if self.buffer else None
+
+    def top_up(self):
+        """Start a background fill if the buffer is short and none is running."""
+        if len(self.buffer) >= RADIO_BUFFER or not self._seeds:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._fill())
+
+    async def next(self):
+        """The next candidate, waiting briefly for a fill if none is ready."""
+        if not self.buffer:
+            self.top_up()
+            task = self._task
+            if task and not task.done():
+                try:
+                    await asyncio.wait_for(asyncio.shield(task), RADIO_WAIT)
+                except asyncio.CancelledError:
+                    if not task.cancelled():
+                        raise  # we were cancelled, not the fill
+                    # clear() (a /stop) cancelled the fill; there's nothing to play.
+                except Exception:
+                    pass
+        track = self.buffer.popleft() if self.buffer else None
+        self.top_up()
+        return track
+
+    def clear(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self.buffer.clear()
+
+    async def _fill(self):
+        # Newest seed first; older ones only if its mix has nothing new left.
+        for seed in reversed(list(self._seeds)):
+            try:
+                async for batch in self._list(
+                    mix_url(seed), guild_id=self.guild_id, limit=RADIO_MIX_SIZE,
+                    priority=PRIORITY_PREFETCH,
+                ):
+                    for entry in batch:
+                        if entry['id'] in self.recent:
+                            continue
+                        # Reserved up front so a failed or parallel pick isn't retried.
+                        self.recent.add(entry['id'])
+                        track = Track(
+                            f"https://www.youtube.com/watch?v={entry['id']}",
+                            title=entry['title'], video_id=entry['id'], duration=entry['duration'],
+                        )
+                        try:
+                            data = await self._extract(
+                                track.lookup, guild_id=self.guild_id, priority=PRIORITY_PREFETCH
+                            )
+                        except Exception as e:
+                            print(f"[radio] {track.query}: {e}")
+                            continue
+                        track.update(data)
+                        self.buffer.append(track)
+                        if len(self.buffer) == 1 and self._on_candidate:
+                            self._on_candidate()
+                        if len(self.buffer) >= RADIO_BUFFER:
+                            return
+            except Exception as e:
+                print(f"[radio] mix for {seed}: {e}")
+            if self.buffer:
+                return
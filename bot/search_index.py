@@ -0,0 +1,157 @@
+import os
+import re
+import sqlite3
+import time
+
+from bot.cache import SQLiteWriter, normalize_key, open_sqlite
+
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", "cache/search.db")  # empty disables it
+SEARCH_RESULTS = 25  # Discord shows at most 25 autocomplete choices
+MAX_TERMS = 5
+CHOICE_LENGTH = 100  # Discord's limit on choice names and values
+
+_WORD = re.compile(r"\w+")
+
+
+def words(text):
+    return set(_WORD.findall(text.casefold()))
+
+
+def title_key(title):
+    """Normalised title, cut where an autocomplete value would be cut."""
+    return " ".join(title[:CHOICE_LENGTH].casefold().split())
+
+
+class SearchIndex:
+    """Word-prefix index over the songs our guilds have played, in SQLite.
+
+    Every resolved track that starts playing is added (title and uploader
+    words), along with the free-text query that found it. That gives /play
+    an autocomplete that never touches YouTube, and lets a known query or
+    title go straight to its video id instead of a ytsearch. Writes go
+    through a SQLiteWriter, off the event loop.
+    """
+
+    def __init__(self, path=SEARCH_INDEX_PATH):
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        self._writer = None
+        if path:
+            try:
+                self._db = self._open(path)
+                self._writer = SQLiteWriter(path, 'search index')
+            except sqlite3.Error as e:
+                print(f"[search index] unavailable: {e}")
+                self._db = None
+
+    def _open(self, path):
+        db = open_sqlite(path)
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS tracks ("
+            " video_id TEXT PRIMARY KEY, title TEXT NOT NULL, title_key TEXT NOT NULL,"
+            " duration REAL, plays INTEGER NOT NULL, last_played REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS tracks_title ON tracks (title_key)")
+        db.execute(
+            "CREATE INDEX IF NOT EXISTS tracks_popular ON tracks (plays DESC, last_played DESC)"
+        )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS words ("
+            " word TEXT NOT NULL, video_id TEXT NOT NULL, PRIMARY KEY (word, video_id)"
+            ") WITHOUT ROWID"
+        )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS queries ("
+            " query TEXT PRIMARY KEY, video_id TEXT NOT NULL) WITHOUT ROWID"
+        )
+        db.commit()
+        return db
+
+    def record(self, data, query=None):
+        """Index a resolved track that started playing; query is what was asked for."""
+        video_id, title = data.get('id'), data.get('title')
+        if self._db is None or not video_id or not title:
+            return
+        key = normalize_key(query) if query else ''
+        self._writer.submit(
+            self._store, video_id, title, data.get('duration'),
+            f"{title} {data.get('uploader') or ''}", key if key.startswith('q:') else None,
+        )
+
+    def _store(self, db, video_id, title, duration, text, key):
+        known = db.execute("SELECT 1 FROM tracks WHERE video_id = ?", (video_id,)).fetchone()
+        db.execute(
+            "INSERT INTO tracks VALUES (?, ?, ?, ?, 1, ?) ON CONFLICT (video_id) DO UPDATE"
+            " SET title = excluded.title, title_key = excluded.title_key,"
+            " duration = excluded.duration, plays = plays + 1,"
+            " last_played = excluded.last_played",
+            (video_id, title, title_key(title), duration, time.time()),
+        )
+        if not known:
+            db.executemany(
+                "INSERT OR IGNORE INTO words VALUES (?, ?)",
+                [(word, video_id) for word in words(text)],
+            )
+        if key:
+            db.execute("INSERT OR REPLACE INTO queries VALUES (?, ?)", (key, video_id))
+
+    def search(self, text, limit=SEARCH_RESULTS):
+        """[(video_id, title, duration)] whose words start with each word of text.
+
+        Most played first; with no text, just the most played songs.
+        """
+        if self._db is None:
+            return []
+        terms = sorted(words(text), key=len, reverse=True)[:MAX_TERMS]
+        clauses = " AND ".join(
+            "video_id IN (SELECT video_id FROM words WHERE word >= ? AND word < ?)" for _ in terms
+        )
+        params = [bound for term in terms for bound in (term, term + "\U0010ffff")]
+        try:
+            return self._db.execute(
+                "SELECT video_id, title, duration FROM tracks"
+                + (f" WHERE {clauses}" if clauses else "")
+                + " ORDER BY plays DESC, last_played DESC LIMIT ?",
+                (*params, limit),
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"[search index] read failed: {e}")
+            return []
+
+    def lookup(self, query):
+        """Track fields for a free-text query we've resolved before, or None.
+
+        Matches a query that was searched before or a known title (which is
+        what autocomplete choices submit).
+        """
+        key = normalize_key(query)
+        if self._db is None or not key.startswith('q:'):
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT t.video_id, t.title, t.duration FROM queries q"
+                " JOIN tracks t ON t.video_id = q.video_id WHERE q.query = ?",
+                (key,),
+            ).fetchone() or self._db.execute(
+                "SELECT video_id, title, duration FROM tracks WHERE title_key = ?"
+                " ORDER BY plays DESC LIMIT 1",
+                (title_key(query),),
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"[search index] read failed: {e}")
+            return None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        video_id, title, duration = row
+        return {'video_id': video_id, 'title': title, 'duration': duration}
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._db is not None:
+            self._db.close()
+            self._db = None
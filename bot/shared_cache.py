@@ -0,0 +1,91 @@
+import json
+import os
+import sqlite3
+import time
+
+from bot.cache import SQLiteWriter, open_sqlite
+
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "cache/shared.db")  # empty disables it
+SHARED_CACHE_MAX_ROWS = int(os.getenv("SHARED_CACHE_MAX_ROWS", "2000"))
+TRIM_EVERY = 100  # puts between size checks
+
+
+class SharedCache:
+    """Small JSON key/value store with per-entry TTLs, backed by SQLite.
+
+    Every bot process in a cluster opens the same file (WAL mode lets them
+    read while one writes), so a result fetched by one worker is there for
+    all of them. Single-process setups get a cache that survives restarts.
+    Values are encoded and written on a SQLiteWriter's thread.
+    """
+
+    def __init__(self, namespace, path=SHARED_CACHE_PATH, max_rows=SHARED_CACHE_MAX_ROWS):
+        self.namespace = namespace
+        self.max_rows = max_rows
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        self._writer = None
+        if path:
+            try:
+                self._db = self._open(path)
+                self._writer = SQLiteWriter(path, 'shared cache')
+            except sqlite3.Error as e:
+                print(f"[shared cache] {namespace} store unavailable: {e}")
+                self._db = None
+
+    def _open(self, path):
+        db = open_sqlite(path)
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS shared ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+            " expires REAL NOT NULL, PRIMARY KEY (namespace, key))"
+        )
+        db.commit()
+        return db
+
+    def get(self, key):
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT value FROM shared WHERE namespace = ? AND key = ? AND expires > ?",
+                (self.namespace, key, time.time()),
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"[shared cache] read failed: {e}")
+            return None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, value, ttl):
+        """Store value for ttl seconds; value must not change afterwards."""
+        if self._db is None:
+            return
+        self._puts += 1
+        self._writer.submit(
+            self._store, key, value, time.time() + ttl, self._puts % TRIM_EVERY == 0
+        )
+
+    def _store(self, db, key, value, expires, trim):
+        db.execute(
+            "INSERT OR REPLACE INTO shared VALUES (?, ?, ?, ?)",
+            (self.namespace, key, json.dumps(value), expires),
+        )
+        if trim:
+            self._trim(db)
+
+    def _trim(self, db):
+        db.execute("DELETE FROM shared WHERE expires <= ?", (time.time(),))
+        db.execute(
+            "DELETE FROM shared WHERE namespace = ? AND key NOT IN ("
+            " SELECT key FROM shared WHERE namespace = ? ORDER BY expires DESC LIMIT ?)",
+            (self.namespace, self.namespace, self.max_rows),
+        )
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,183 @@
+import asyncio
+import os
+import re
+import time
+
+import aiohttp
+
+from bot.shared_cache import SharedCache
+
+SPOTIPY_CLIENT_ID = os.getenv("SPOTIPY_CLIENT_ID")
+SPOTIPY_CLIENT_SECRET = os.getenv("SPOTIPY_CLIENT_SECRET")
+SPOTIFY_MARKET = os.getenv("SPOTIFY_MARKET", "US")
+
+API_URL = "https://api.spotify.com/v1"
+TOKEN_URL = "https://accounts.spotify.com/api/token"
+
+PAGE_CONCURRENCY = 4  # pages fetched at once after the first one
+MAX_RETRIES = 3
+
+# How long a resolved link's track list is reused, by link kind.
+CACHE_TTLS = {
+    'track': 7 * 24 * 3600,
+    'album': 7 * 24 * 3600,
+    'artist': 24 * 3600,
+    'playlist': 3600,
+}
+CACHED_BATCH = 100
+
+_LINK = re.compile(
+    r'(?:open\.spotify\.com/(?:intl-[a-z]+/)?|spotify:)(track|playlist|album|artist)[/:]([A-Za-z0-9]+)'
+)
+
+
+class SpotifyError(RuntimeError):
+    pass
+
+
+def parse_link(url):
+    """Return (kind, id) for a Spotify URL/URI, or None."""
+    match = _LINK.search(url)
+    return (match.group(1), match.group(2)) if match else None
+
+
+def is_spotify(query):
+    return parse_link(query) is not None
+
+
+def track_query(track):
+    """Turn a Spotify track object into (search query, duration in seconds)."""
+    if not track or not track.get('artists') or not track.get('name'):
+        return None
+    duration = track.get('duration_ms')
+    return (f"{track['artists'][0]['name']} {track['name']}", duration / 1000 if duration else None)
+
+
+class SpotifyClient:
+    """Minimal async Web API client on one pooled aiohttp session."""
+
+    def __init__(self, client_id=SPOTIPY_CLIENT_ID, client_secret=SPOTIPY_CLIENT_SECRET):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self._session = None
+        self._token = None
+        self._token_expires = 0
+        self._token_lock = None
+        self.cache = SharedCache('spotify')
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=20),
+                connector=aiohttp.TCPConnector(limit_per_host=PAGE_CONCURRENCY + 2),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+    async def _get_token(self):
+        if self._token and time.time() < self._token_expires:
+            return self._token
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        async with self._token_lock:
+            if self._token and time.time() < self._token_expires:
+                return self._token
+            if not self.client_id or not self.client_secret:
+                raise SpotifyError("Spotify credentials are not configured.")
+            auth = aiohttp.BasicAuth(self.client_id, self.client_secret)
+            async with self._get_session().post(
+                TOKEN_URL, data={'grant_type': 'client_credentials'}, auth=auth
+            ) as resp:
+                if resp.status != 200:
+                    raise SpotifyError(f"Token request failed ({resp.status}).")
+                payload = await resp.json()
+            self._token = payload['access_token']
+            self._token_expires = time.time() + payload.get('expires_in', 3600) - 60
+            return self._token
+
+    async def _get(self, path, **params):
+        for attempt in range(MAX_RETRIES + 1):
+            headers = {'Authorization': f"Bearer {await self._get_token()}"}
+            async with self._get_session().get(
+                f"{API_URL}{path}", params=params, headers=headers
+            ) as resp:
+                if resp.status == 200:
+                    return await resp.json()
+                if resp.status == 401:
+                    self._token = None
+                elif resp.status == 429 or resp.status >= 500:
+                    delay = float(resp.headers.get('Retry-After', 1 + attempt))
+                    await asyncio.sleep(delay)
+                else:
+                    raise SpotifyError(f"GET {path} failed ({resp.status}).")
+        raise SpotifyError(f"GET {path} kept failing after {MAX_RETRIES} retries.")
+
+    async def _pages(self, path, limit, **params):
+        """Yield each page's items, in order; pages after the first are
+        requested concurrently as soon as the total is known."""
+        first = await self._get(path, offset=0, limit=limit, **params)
+        yield first.get('items', [])
+
+        semaphore = asyncio.Semaphore(PAGE_CONCURRENCY)
+
+        async def fetch(offset):
+            async with semaphore:
+                return await self._get(path, offset=offset, limit=limit, **params)
+
+        tasks = [
+            asyncio.ensure_future(fetch(offset))
+            for offset in range(limit, first.get('total', 0), limit)
+        ]
+        try:
+            for task in tasks:
+                page = await task
+                yield page.get('items', [])
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def iter_tracks(self, url):
+        """Yield batches of (query, duration) for a track/playlist/album/artist link.
+
+        Complete results are kept in the shared cache, so re-queuing a
+        playlist (from any cluster worker) costs no API calls until it expires.
+        """
+        link = parse_link(url)
+        if link is None:
+            raise SpotifyError("Unsupported Spotify link.")
+        kind, item_id = link
+
+        key = f"{kind}:{item_id}:{SPOTIFY_MARKET}"
+        cached = self.cache.get(key)
+        if cached is not None:
+            for start in range(0, len(cached), CACHED_BATCH):
+                yield [tuple(item) for item in cached[start:start + CACHED_BATCH]]
+            return
+
+        found = []
+        async for batch in self._fetch_tracks(kind, item_id):
+            found.extend(batch)
+            yield batch
+        self.cache.put(key, found, CACHE_TTLS[kind])
+
+    async def _fetch_tracks(self, kind, item_id):
+        if kind == "track":
+            found = track_query(await self._get(f"/tracks/{item_id}"))
+            yield [found] if found else []
+        elif kind == "artist":
+            data = await self._get(f"/artists/{item_id}/top-tracks", market=SPOTIFY_MARKET)
+            yield [q for q in map(track_query, data.get('tracks', [])) if q]
+        elif kind == "album":
+            async for items in self._pages(f"/albums/{item_id}/tracks", 50):
+                yield [q for q in map(track_query, items) if q]
+        else:
+            async for items in self._pages(
+                f"/playlists/{item_id}/tracks", 100, market=SPOTIFY_MARKET
+            ):
+                yield [q for q in (track_query(item.get('track')) for item in items) if q]
+
+
+spotify = SpotifyClient()
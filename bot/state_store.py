@@ -0,0 +1,211 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bot.cache import open_sqlite
+
+STATE_PATH = os.getenv("STATE_PATH", "cache/state.db")  # empty disables persistence
+STATE_FLUSH_SECONDS = float(os.getenv("STATE_FLUSH_SECONDS", "5"))
+
+
+class StateStore:
+    """Per-guild player state in SQLite, so a restart doesn't lose queues.
+
+    Writes are batched: flush() collects what changed since the last write
+    and commits it in one transaction on a dedicated thread, off the event
+    loop. Queues are stored a row per track, keyed by the queue's sequence
+    numbers, so advancing deletes one row and appending inserts only the
+    new tracks; only a shuffle or clear rewrites the lot.
+    """
+
+    def __init__(self, path=STATE_PATH):
+        self.path = path
+        self._db = None
+        self._reader = None
+        self._executor = None
+        # guild id -> (queue, version, rewrites, first, end, pushes, player row) last saved
+        self._written = {}
+        if path:
+            try:
+                self._db = self._open(path)
+                self._reader = sqlite3.connect(path)
+            except sqlite3.Error as e:
+                print(f"[state] store unavailable, queues won't survive restarts: {e}")
+                self._db = None
+
+    @property
+    def enabled(self):
+        return self._db is not None
+
+    def _open(self, path):
+        db = open_sqlite(path, check_same_thread=False)
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS guilds ("
+            " guild_id INTEGER PRIMARY KEY, current TEXT, position REAL NOT NULL,"
+            " loop_song INTEGER NOT NULL, loop_queue INTEGER NOT NULL, global_filter TEXT,"
+            " voice_channel INTEGER, text_channel INTEGER, updated REAL NOT NULL)"
+        )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS queue_tracks ("
+            " guild_id INTEGER NOT NULL, seq INTEGER NOT NULL, track TEXT NOT NULL,"
+            " PRIMARY KEY (guild_id, seq)) WITHOUT ROWID"
+        )
+        db.commit()
+        return db
+
+    def _run(self, fn, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state")
+        return asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    # ---------------- Reading ----------------
+
+    def load(self, guild_id):
+        """Saved state for one guild, or None."""
+        if not self.enabled:
+            return None
+        try:
+            row = self._reader.execute(
+                "SELECT current, position, loop_song, loop_queue, global_filter,"
+                " voice_channel, text_channel FROM guilds WHERE guild_id = ?",
+                (guild_id,),
+            ).fetchone()
+            tracks = self._reader.execute(
+                "SELECT track FROM queue_tracks WHERE guild_id = ? ORDER BY seq", (guild_id,)
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"[state] could not load guild {guild_id}: {e}")
+            return None
+        if row is None and not tracks:
+            return None
+        state = {'queue': [json.loads(track) for track, in tracks]}
+        if row:
+            current, position, loop_song, loop_queue, global_filter, voice, text = row
+            state.update(
+                current=json.loads(current) if current else None, position=position,
+                loop_song=bool(loop_song), loop_queue=bool(loop_queue),
+                global_filter=global_filter, voice_channel=voice, text_channel=text,
+            )
+        return state
+
+    def sessions(self):
+        """(guild id, voice channel, text channel, position) for guilds that
+        were playing when the process stopped."""
+        if not self.enabled:
+            return []
+        try:
+            return self._reader.execute(
+                "SELECT guild_id, voice_channel, text_channel, position FROM guilds"
+                " WHERE voice_channel IS NOT NULL AND current IS NOT NULL"
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"[state] could not list sessions: {e}")
+            return []
+
+    # ---------------- Writing ----------------
+
+    def _changes(self, music):
+        guild_id = music.guild.id
+        vc = music.guild.voice_client
+        player = (
+            music.current.to_row() if music.current else None,
+            round(music.position),
+            music.loop_song,
+            music.loop_queue,
+            music.global_filter,
+            vc.channel.id if vc and music.current else None,
+            getattr(music.text_channel, 'id', None),
+        )
+        queue = music.queue
+        written = self._written.get(guild_id)
+        full = written is None or written[0] is not queue or written[2] != queue.rewrites
+        queue_changed = full or written[1] != queue.version
+        if not queue_changed and written[6] == player:
+            return None
+        self._written[guild_id] = (
+            queue, queue.version, queue.rewrites, queue.first, queue.first + len(queue),
+            queue.pushes, player,
+        )
+        if music.current is None and not queue:
+            return guild_id, None, None
+        if not queue_changed:
+            return guild_id, player, None
+        # The tracks are picked here, on the loop; encoding happens in the writer.
+        if full:
+            return guild_id, player, (queue.first, True, [(queue.first, list(queue))])
+        written_end, written_pushes = written[4], written[5]
+        # appendleft() only ever refills the front slots; everything past the
+        # old end was appended since.
+        pushed = min(queue.pushes - written_pushes, len(queue))
+        start = max(written_end - queue.first, pushed)
+        runs = [(queue.first, queue[:pushed]), (queue.first + start, queue[start:])]
+        return guild_id, player, (queue.first, False, [run for run in runs if run[1]])
+
+    def _write(self, changes):
+        now = time.time()
+        try:
+            with self._db:
+                for guild_id, player, tracks in changes:
+                    if player is None:  # nothing left to restore
+                        self._db.execute("DELETE FROM guilds WHERE guild_id = ?", (guild_id,))
+                        self._db.execute("DELETE FROM queue_tracks WHERE guild_id = ?", (guild_id,))
+                        continue
+                    current, position, loop_song, loop_queue, global_filter, voice, text = player
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO guilds VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (guild_id, json.dumps(current) if current else None, position,
+                         int(loop_song), int(loop_queue), global_filter, voice, text, now),
+                    )
+                    if tracks is not None:
+                        self._write_queue(guild_id, *tracks)
+            return True
+        except sqlite3.Error as e:
+            print(f"[state] write failed: {e}")
+            return False
+
+    def _write_queue(self, guild_id, first, full, runs):
+        """Drop rows before the head (all of them for a rewrite), then write runs
+        of (first sequence number, tracks)."""
+        if full:
+            self._db.execute("DELETE FROM queue_tracks WHERE guild_id = ?", (guild_id,))
+        else:
+            self._db.execute(
+                "DELETE FROM queue_tracks WHERE guild_id = ? AND seq < ?", (guild_id, first)
+            )
+        for seq, tracks in runs:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO queue_tracks VALUES (?, ?, ?)",
+                ((guild_id, seq + i, json.dumps(track.to_row())) for i, track in enumerate(tracks)),
+            )
+
+    async def flush(self, musics):
+        """Write every guild whose state changed since the last flush."""
+        if not self.enabled:
+            return True
+        changes = [change for change in map(self._changes, musics) if change]
+        if not changes:
+            return True
+        ok = await self._run(self._write, changes)
+        if not ok:
+            for guild_id, _, _ in changes:
+                self._written.pop(guild_id, None)  # retry in full next time
+        return ok
+
+    async def save(self, music):
+        return await self.flush([music])
+
+    def forget(self, guild_id):
+        """Stop tracking an evicted guild; its saved rows stay on disk."""
+        self._written.pop(guild_id, None)
+
+    def close(self):
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        for db in (self._db, self._reader):
+            if db:
+                db.close()
+        self._db = self._reader = None
@@ -0,0 +1,76 @@
+import time
+from collections import deque
+
+from bot import metrics
+
+TIMING_WINDOW = 2048  # recent samples kept per stage for percentiles
+
+# Stages of getting a song to the listener, in pipeline order.
+STAGES = (
+    'spotify',  # Spotify link -> first batch of tracks queued
+    'extract',  # yt-dlp resolution (or cache hit) while a track is starting
+    'ffmpeg_spawn',  # building the audio source: FFmpeg slot wait and process start
+    'first_packet',  # FFmpeg connecting and probing until its first packet (ready())
+    'handoff',  # vc.play() -> the audio thread takes that packet
+    'start',  # track start requested -> first audio packet read
+    'gap',  # previous song ended -> next song's first packet
+)
+QUANTILES = (0.5, 0.95, 0.99)
+
+STAGE_SECONDS = metrics.histogram(
+    "play_stage_seconds", "Time spent in each stage of starting a song.",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30),
+)
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class StageTimings:
+    """Recent (seconds, guild id) samples per stage.
+
+    Prometheus gets one label per stage; the guild id stays in the ring
+    buffer instead of a label, so per-guild breakdowns don't blow up the
+    number of series.
+    """
+
+    def __init__(self, window=TIMING_WINDOW):
+        self._samples = {stage: deque(maxlen=window) for stage in STAGES}
+
+    def record(self, stage, seconds, guild_id=None):
+        self._samples[stage].append((seconds, guild_id))
+        STAGE_SECONDS.observe(seconds, stage=stage)
+
+    def since(self, stage, started, guild_id=None):
+        """Record the time from a time.perf_counter() mark until now."""
+        self.record(stage, time.perf_counter() - started, guild_id)
+
+    def summary(self, guild_id=None):
+        """[(stage, count, p50, p95, p99)] for stages with samples."""
+        rows = []
+        for stage in STAGES:
+            values = sorted(
+                seconds for seconds, guild in self._samples[stage]
+                if guild_id is None or guild == guild_id
+            )
+            if values:
+                rows.append((stage, len(values), *(percentile(values, q) for q in QUANTILES)))
+        return rows
+
+    def quantile_samples(self):
+        return [
+            ({'stage': stage, 'quantile': str(q)}, value)
+            for stage, _, *values in self.summary()
+            for q, value in zip(QUANTILES, values)
+        ]
+
+
+timings = StageTimings()
+metrics.gauge(
+    "play_stage_seconds_quantile", f"Stage time percentiles over the last {TIMING_WINDOW} samples.",
+    fn=timings.quantile_samples,
+)
@@ -0,0 +1,180 @@
+import random
+from itertools import islice
+
+COMPACT_MIN = 256  # don't bother reclaiming fewer consumed slots than this
+
+
+class Track:
+    """One queued song: the query to resolve plus whatever we know about it."""
+
+    __slots__ = ('query', 'filters', 'title', 'video_id', 'duration', 'thumbnail')
+
+    def __init__(self, query, filters=None, *, title=None, video_id=None, duration=None,
+                 thumbnail=None):
+        self.query = query
+        self.filters = filters
+        self.title = title
+        self.video_id = video_id
+        self.duration = duration
+        self.thumbnail = thumbnail
+
+    @property
+    def display_title(self):
+        return self.title or self.query
+
+    @property
+    def lookup(self):
+        """What to hand the extractor: the known video beats a fresh search."""
+        if self.video_id:
+            return f"https://www.youtube.com/watch?v={self.video_id}"
+        return self.query
+
+    def with_filters(self, filters):
+        return Track(
+            self.query, filters, title=self.title, video_id=self.video_id,
+            duration=self.duration, thumbnail=self.thumbnail,
+        )
+
+    def to_row(self):
+        """Compact JSON-friendly form, for spilling queues to disk."""
+        return [self.query, self.filters, self.title, self.video_id, self.duration, self.thumbnail]
+
+    @classmethod
+    def from_row(cls, row):
+        query, filters, title, video_id, duration, thumbnail = row
+        return cls(
+            query, filters, title=title, video_id=video_id, duration=duration,
+            thumbnail=thumbnail,
+        )
+
+    def update(self, data):
+        """Remember metadata from a resolved yt-dlp info dict."""
+        self.title = data.get('title') or self.title
+        self.video_id = data.get('id') or self.video_id
+        self.duration = data.get('duration') or self.duration
+        self.thumbnail = data.get('thumbnail') or self.thumbnail
+
+    def __repr__(self):
+        return f"<Track {self.display_title!r}>"
+
+
+class TrackQueue:
+    """FIFO of Tracks with O(1) popleft/append and O(1) index access.
+
+    Backed by a list plus a head offset: popping advances the offset and the
+    consumed prefix is dropped in one go once it outgrows the live part, so
+    every operation stays amortised O(1) even for 10k-track imports.
+
+    Each track also has a sequence number (first is the head's), which only
+    shuffle() and clear() renumber. That lets the state store write the
+    rows that changed instead of the whole queue.
+    """
+
+    def __init__(self, tracks=()):
+        self._items = list(tracks)
+        self._head = 0
+        self.version = 0  # bumped on every change, for snapshots/persistence
+        self.first = 0  # sequence number of the head track
+        self.pushes = 0  # appendleft() calls, which reuse sequence numbers
+        self.rewrites = 0  # shuffle()/clear() calls, which renumber everything
+
+    def __len__(self):
+        return len(self._items) - self._head
+
+    def __bool__(self):
+        return len(self._items) > self._head
+
+    def __iter__(self):
+        return islice(self._items, self._head, None)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            return self._items[self._head + start:self._head + stop:step]
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("queue index out of range")
+        return self._items[self._head + index]
+
+    def _changed(self):
+        self.version += 1
+        if self._head == len(self._items):
+            self._items = []
+            self._head = 0
+        elif self._head >= COMPACT_MIN and self._head * 2 >= len(self._items):
+            del self._items[:self._head]
+            self._head = 0
+
+    def append(self, track):
+        self._items.append(track)
+        self.version += 1
+
+    def extend(self, tracks):
+        self._items.extend(tracks)
+        self.version += 1
+
+    def appendleft(self, track):
+        if self._head:
+            self._head -= 1
+            self._items[self._head] = track
+        else:
+            self._items.insert(0, track)
+        self.first -= 1
+        self.pushes += 1
+        self.version += 1
+
+    def popleft(self):
+        if not self:
+            raise IndexError("pop from an empty queue")
+        track = self._items[self._head]
+        self._items[self._head] = None
+        self._head += 1
+        self.first += 1
+        self._changed()
+        return track
+
+    def drop(self, count):
+        """Discard the first count tracks in O(1).
+
+        The dropped slots keep their references until the next compaction,
+        which is bounded by the size of the live queue.
+        """
+        count = max(0, min(count, len(self)))
+        self._head += count
+        self.first += count
+        self._changed()
+
+    def rotate(self, count):
+        """Move the first count tracks to the back (skipto under loop_queue)."""
+        count = max(0, min(count, len(self)))
+        self._items.extend(self._items[self._head:self._head + count])
+        self.drop(count)
+
+    def window(self, start, count):
+        """Tracks start..start+count-1, for paging."""
+        return self[start:start + count]
+
+    def find(self, predicate, start=0):
+        """Index of the first track from start on (wrapping round) matching predicate."""
+        size = len(self)
+        for offset in range(size):
+            index = (start + offset) % size
+            if predicate(self._items[self._head + index]):
+                return index
+        return None
+
+    def shuffle(self):
+        if self._head:
+            del self._items[:self._head]
+            self._head = 0
+        random.shuffle(self._items)
+        self.rewrites += 1
+        self.version += 1
+
+    def clear(self):
+        self._items = []
+        self._head = 0
+        self.rewrites += 1
+        self.version += 1
@@ -1,15 +1,69 @@
-from flask import Flask
-from threading import Thread
+import math
+import os
+import time
 
-app = Flask('')
+from aiohttp import web
 
-@app.route('/')
-def home():
-    return "Bot is running!"
+from bot import metrics
 
-def run():
-    app.run(host='0.0.0.0', port=8080)
+PORT = int(os.getenv("PORT", "8080"))
+MAX_HEALTHY_LAG = float(os.getenv("MAX_HEALTHY_LAG", "2"))  # seconds of event loop lag
 
-def keep_alive():
-    t = Thread(target=run)
-    t.start()
+STARTED = time.time()
+
+
+def bot_health(bot):
+    """(alive, ready, details) from the gateway and voice connections."""
+    lag = metrics.LOOP_LAG.value() or 0.0
+    details = {'uptime': round(time.time() - STARTED), 'loop_lag': round(lag, 4)}
+    if bot is None:
+        return lag < MAX_HEALTHY_LAG, True, details
+
+    shards = getattr(bot, 'shards', {}) or {}
+    down = sorted(shard_id for shard_id, shard in shards.items() if shard.is_closed())
+    voice = bot.voice_clients
+    details.update(
+        gateway='ready' if bot.is_ready() else 'starting',
+        latency=round(bot.latency, 3) if math.isfinite(bot.latency) else None,
+        shards_down=down,
+        voice_connected=sum(1 for vc in voice if vc.is_connected()),
+        voice_total=len(voice),
+    )
+    alive = not bot.is_closed() and lag < MAX_HEALTHY_LAG
+    ready = alive and bot.is_ready() and not down
+    return alive, ready, details
+
+
+def make_app(bot=None, health=bot_health):
+    """Health and metrics endpoints, served from the bot's own event loop."""
+    app = web.Application()
+
+    async def home(request):
+        return web.Response(text="Bot is running!")
+
+    async def healthz(request):
+        alive, _, details = health(bot)
+        return web.json_response(details, status=200 if alive else 503)
+
+    async def readyz(request):
+        _, ready, details = health(bot)
+        return web.json_response(details, status=200 if ready else 503)
+
+    async def metrics_page(request):
+        return web.Response(text=metrics.render(), content_type='text/plain', charset='utf-8')
+
+    app.router.add_get('/', home)
+    app.router.add_get('/healthz', healthz)
+    app.router.add_get('/readyz', readyz)
+    app.router.add_get('/metrics', metrics_page)
+    return app
+
+
+async def keep_alive(bot=None, port=PORT, health=bot_health):
+    """Start the HTTP server and the loop lag probe on the running loop."""
+    runner = web.AppRunner(make_app(bot, health), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '0.0.0.0', port).start()
+    metrics.start_loop_lag_probe()
+    print(f"Health server listening on port {port}")
+    return runner
@@ -1,38 +1,113 @@
 import os
-from dotenv import load_dotenv
-from keep_alive import keep_alive
+import time
+
+STARTED = time.perf_counter()
 
-keep_alive()
+from dotenv import load_dotenv
 
 load_dotenv()
 
+# Cluster workers (see bot/cluster.py) get their shards from the supervisor.
+SHARD_IDS = os.getenv("SHARD_IDS")
+SHARD_COUNT = os.getenv("SHARD_COUNT")
+CLUSTER_WORKER = os.getenv("CLUSTER_WORKER")
+
+import hashlib
+import json
+
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 
 from bot.music_cog import MusicCog
+from bot.procstat import rss_bytes
+from keep_alive import keep_alive, PORT
 
 TOKEN = os.getenv("DISCORD_TOKEN")
+COMMAND_HASH_PATH = os.getenv("COMMAND_HASH_PATH", "cache/commands.sha256")
+FOOTPRINT_REPORT_MINUTES = float(os.getenv("FOOTPRINT_REPORT_MINUTES", "30"))
+
+# Slash commands only need guilds (for channels) and voice states (for
+# "join the user's channel"). No member list or presence caching.
+intents = discord.Intents.none()
+intents.guilds = True
+intents.voice_states = True
 
-intents = discord.Intents.all()
-bot = commands.Bot(command_prefix="!", intents=intents)
+bot_options = dict(
+    command_prefix="!",
+    intents=intents,
+    member_cache_flags=discord.MemberCacheFlags.none(),
+    chunk_guilds_at_startup=False,
+    activity=discord.Activity(type=discord.ActivityType.listening, name="your queue 🎵"),
+)
+if SHARD_IDS:
+    bot = commands.AutoShardedBot(
+        **bot_options,
+        shard_ids=[int(shard) for shard in SHARD_IDS.split(",")],
+        shard_count=int(SHARD_COUNT),
+    )
+else:
+    # discord.py picks the shard count Discord recommends.
+    bot = commands.AutoShardedBot(**bot_options)
 
 
-@bot.event
-async def on_ready():
-    print(f"Logged in as {bot.user}")
+def rss_mb():
+    rss = rss_bytes()
+    return rss / (1024 * 1024) if rss else 0.0
+
+
+def command_hash():
+    """Hash of the slash command definitions, to skip no-op syncs."""
+    payload = [command.to_dict(bot.tree) for command in bot.tree.get_commands()]
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+async def sync_commands():
+    digest = command_hash()
+    try:
+        with open(COMMAND_HASH_PATH) as f:
+            if f.read().strip() == digest:
+                print("Slash commands unchanged; skipping sync.")
+                return
+    except OSError:
+        pass
     try:
         synced = await bot.tree.sync()
         print(f"Synced {len(synced)} slash commands.")
     except Exception as e:
         print(f"Error syncing commands: {e}")
-    await bot.change_presence(
-        activity=discord.Activity(type=discord.ActivityType.listening, name="your queue 🎵")
-    )
+        return
+    directory = os.path.dirname(COMMAND_HASH_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(COMMAND_HASH_PATH, 'w') as f:
+        f.write(digest)
+
+
+@tasks.loop(minutes=FOOTPRINT_REPORT_MINUTES)
+async def report_footprint():
+    cog = bot.get_cog("MusicCog")
+    players = len(cog.music_instances) if cog else 0
+    print(f"[footprint] rss {rss_mb():.0f} MB, {len(bot.guilds)} guilds, {players} players")
+
+
+@bot.event
+async def on_ready():
+    # Also fires after gateway reconnects; only the first one is a cold start.
+    if report_footprint.is_running():
+        return
+    print(f"Logged in as {bot.user}")
+    print(f"[footprint] ready in {time.perf_counter() - STARTED:.1f}s, rss {rss_mb():.0f} MB")
+    report_footprint.start()
 
 
 @bot.event
 async def setup_hook():
     await bot.add_cog(MusicCog(bot))
+    # The supervisor owns PORT in cluster mode; each worker takes the next ones.
+    port = PORT + 1 + int(CLUSTER_WORKER) if CLUSTER_WORKER else PORT
+    await keep_alive(bot, port=port)
+    # Runs once per process, after login and before the gateway connects.
+    await sync_commands()
 
 
 bot.run(TOKEN)